@@ -21,6 +21,7 @@ class HobexSettingsHolder(OPPWASettingsHolder):
 
 class OPPWAMethod(SuperOPPWAMethod):
     identifier = "hobex"
+    merchant_transaction_id_field = "pk"
 
     def get_merchant_transaction_id(self, payment):
         # For scheme-payments, Hobex only supports a 20 digit transaction ID, deviating from the OPPWA-standard.
@@ -28,6 +29,12 @@ class OPPWAMethod(SuperOPPWAMethod):
         # through Hobex.
         return str(payment.pk).zfill(20)
 
+    @classmethod
+    def parse_merchant_transaction_id(cls, merchant_transaction_id):
+        if not merchant_transaction_id.isdigit():
+            return None
+        return int(merchant_transaction_id)
+
     @property
     def additional_head(self):
         return get_template('pretix_hobex/pay_head.html').render()
@@ -1,5 +1,5 @@
 from pretix_oppwa.paymentmethods import (
-    get_payment_method_classes, payment_methods as payment_methods_repo,
+    LazyPaymentMethodClasses, payment_methods as payment_methods_repo,
 )
 
 from .payment import HobexSettingsHolder, OPPWAMethod
@@ -24,12 +24,8 @@ supported_methods = [
     "GOOGLEPAY",
     "ACI_INSTANTPAY",
 ]
-payment_methods = [
-    item
-    for item in payment_methods_repo
-    if item.get("identifier").upper() in supported_methods
-]
+payment_methods = payment_methods_repo.subset(supported_methods)
 
-payment_method_classes = get_payment_method_classes(
+payment_method_classes = LazyPaymentMethodClasses(
     "Hobex", payment_methods, OPPWAMethod, HobexSettingsHolder
 )
@@ -14,7 +14,7 @@ from pretix_oppwa.signals import (
 def register_payment_provider(sender, **kwargs):
     from .paymentmethods import payment_method_classes
 
-    return payment_method_classes
+    return payment_method_classes()
 
 
 @receiver(signal=process_response, dispatch_uid="payment_hobex_middleware_resp")
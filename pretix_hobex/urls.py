@@ -1,3 +1,5 @@
 from pretix_oppwa.urls import get_event_patterns
 
-event_patterns = get_event_patterns("hobex")
+from .paymentmethods import payment_methods
+
+event_patterns = get_event_patterns("hobex", payment_methods)
@@ -0,0 +1,99 @@
+import requests
+import time
+from django.core.cache import cache
+from urllib.parse import urlsplit
+
+from pretix_oppwa import conf
+
+# The open state is forgotten if no call probes the endpoint for this long
+OPEN_STATE_TIMEOUT = 24 * 3600
+
+_open_memo = {}
+
+
+class CircuitOpen(requests.exceptions.ConnectionError):
+    """
+    Raised instead of calling an endpoint whose circuit breaker is open. The request has not been sent.
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for one endpoint of the payment provider. Its state lives in the cache, so it is shared by
+    all workers.
+
+    The breaker opens once ``circuit_failures`` calls within ``circuit_window`` seconds have failed, timed out,
+    been answered with a server error or taken longer than ``circuit_slow_call`` seconds. While it is open, calls
+    fail immediately with ``CircuitOpen``. After ``circuit_cooldown`` seconds, a single call is let through as a
+    probe: if it succeeds, the breaker closes, otherwise it stays open for another cooldown.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.key = "pretix_oppwa:circuit:{}".format(endpoint)
+        self.max_failures = conf.getint("circuit_failures", 10)
+        self.window = conf.getint("circuit_window", 30)
+        self.cooldown = conf.getint("circuit_cooldown", 30)
+        self.slow_call = conf.getfloat("circuit_slow_call", None)
+        self.probing = False
+
+    def before(self):
+        opened = cache.get(self.key + ":opened")
+        if opened is None:
+            return
+        if time.time() < opened + self.cooldown or not cache.add(self.key + ":probe", True, self.cooldown):
+            raise CircuitOpen("The circuit breaker for {} is open.".format(self.endpoint))
+        self.probing = True
+
+    def success(self):
+        if self.probing:
+            cache.delete_many([self.key + ":opened", self.key + ":probe", self.key + ":failures"])
+
+    def failure(self):
+        if self.probing:
+            cache.set(self.key + ":opened", time.time(), OPEN_STATE_TIMEOUT)
+            cache.delete(self.key + ":probe")
+            return
+
+        failures_key = self.key + ":failures"
+        cache.add(failures_key, 0, self.window)
+        try:
+            failures = cache.incr(failures_key)
+        except ValueError:
+            # The window expired in the meantime
+            cache.set(failures_key, 1, self.window)
+            failures = 1
+        if failures >= self.max_failures:
+            cache.add(self.key + ":opened", time.time(), OPEN_STATE_TIMEOUT)
+
+    def record(self, status, duration):
+        if status >= 500 or (self.slow_call and duration > self.slow_call):
+            self.failure()
+        else:
+            self.success()
+
+
+def get_breaker(url):
+    """
+    Returns a circuit breaker for the endpoint of ``url``, or ``None`` if circuit breakers are disabled.
+    """
+    if not conf.getboolean("circuit_breaker"):
+        return None
+    return CircuitBreaker(urlsplit(url).netloc)
+
+
+def is_open(url):
+    """
+    Whether calls to the endpoint of ``url`` are currently failing fast. This is asked for every payment method
+    whenever pretix lists them, so the answer is kept for a second.
+    """
+    endpoint = urlsplit(url).netloc
+    memo = _open_memo.get(endpoint)
+    if memo and memo[0] > time.monotonic():
+        return memo[1]
+
+    breaker = CircuitBreaker(endpoint)
+    opened = cache.get(breaker.key + ":opened")
+    result = opened is not None and time.time() < opened + breaker.cooldown
+    _open_memo[endpoint] = (time.monotonic() + 1, result)
+    return result
@@ -0,0 +1,104 @@
+import os
+import requests
+import threading
+import time
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+
+from pretix_oppwa import circuit, conf, metrics
+
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+_sessions_pid = None
+
+
+class OPPWASession(requests.Session):
+    """
+    A ``requests`` session that applies the configured connect and read timeouts to every request that
+    does not explicitly set its own. All requests pass the endpoint's circuit breaker and are reported to the
+    metrics backend, if these are enabled.
+    """
+
+    def __init__(self, timeout, brand=None, pool_size=10):
+        super().__init__()
+        self.timeout = timeout
+        self.brand = brand
+        self.pool_size = pool_size
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        breaker = circuit.get_breaker(url)
+        if breaker is None:
+            return self._request(method, url, **kwargs)
+
+        breaker.before()
+        start = time.monotonic()
+        try:
+            r = self._request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            breaker.failure()
+            raise
+        breaker.record(r.status_code, time.monotonic() - start)
+        return r
+
+    def _request(self, method, url, **kwargs):
+        backend = metrics.get_backend()
+        if backend is None:
+            return super().request(method, url, **kwargs)
+
+        with metrics.track_request(backend, self.brand, method, url, self.pool_size) as call:
+            r = super().request(method, url, **kwargs)
+            call.status = r.status_code
+            return r
+
+
+def _build_session(brand, access_token):
+    pool_size = conf.getint("pool_maxsize", 10)
+    s = OPPWASession(
+        timeout=(
+            conf.getfloat("connect_timeout", 5.0),
+            conf.getfloat("read_timeout", 30.0),
+        ),
+        brand=brand,
+        pool_size=pool_size,
+    )
+    # Each session only ever talks to a single endpoint, so we only need a handful of host pools, but we
+    # want enough connections in each of them to serve all threads of a worker without re-connecting.
+    # We never retry on the transport level, since neither checkouts nor refunds are idempotent.
+    adapter = HTTPAdapter(
+        pool_connections=conf.getint("pool_connections", 4),
+        pool_maxsize=pool_size,
+        max_retries=0,
+    )
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    s.headers.update({"Authorization": "Bearer {}".format(access_token)})
+    return s
+
+
+def get_session(brand, endpoint, access_token):
+    """
+    Returns a process-wide, keep-alive session for the given brand, endpoint and access token.
+
+    Sessions are kept in a small LRU so that rotated access tokens do not accumulate, and are discarded
+    after a fork so that worker processes never share sockets with their parent.
+    """
+    global _sessions_pid
+
+    key = (brand, endpoint, access_token)
+    with _sessions_lock:
+        if _sessions_pid != os.getpid():
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+
+        try:
+            _sessions.move_to_end(key)
+            return _sessions[key]
+        except KeyError:
+            pass
+
+        s = _sessions[key] = _build_session(brand, access_token)
+        while len(_sessions) > conf.getint("max_sessions", 32):
+            _, evicted = _sessions.popitem(last=False)
+            evicted.close()
+        return s
@@ -0,0 +1,94 @@
+import json
+import requests
+from django.utils.module_loading import import_string
+
+from pretix_oppwa import conf
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class StdlibCodec:
+    @staticmethod
+    def loads(s):
+        return json.loads(s)
+
+    @staticmethod
+    def dumps(obj):
+        return json.dumps(obj, sort_keys=True)
+
+
+class OrjsonCodec:
+    @staticmethod
+    def loads(s):
+        return orjson.loads(s)
+
+    @staticmethod
+    def dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS).decode()
+
+
+def _get_codec():
+    name = conf.get("json_codec", "auto")
+    if name == "auto":
+        return OrjsonCodec if orjson is not None else StdlibCodec
+    if name == "orjson":
+        return OrjsonCodec
+    if name == "json":
+        return StdlibCodec
+    return import_string(name)
+
+
+_codec = None
+
+
+def get_codec():
+    """
+    Returns the codec for all payloads exchanged with the payment provider, configured through the ``json_codec``
+    option: ``auto`` (orjson if installed, the standard library otherwise), ``orjson``, ``json`` or the dotted
+    path to any object with ``loads`` and ``dumps``. ``dumps`` must return a ``str`` with sorted keys, like
+    pretix does when setting ``info_data``.
+    """
+    global _codec
+    if _codec is None:
+        _codec = _get_codec()
+    return _codec
+
+
+def loads(s):
+    return get_codec().loads(s)
+
+
+def dumps(obj):
+    return get_codec().dumps(obj)
+
+
+def response_json(r: requests.Response):
+    """
+    Decodes the body of a response. Like ``Response.json()``, errors are raised as ``RequestException``.
+    """
+    try:
+        return get_codec().loads(r.content)
+    except ValueError as e:
+        raise requests.exceptions.InvalidJSONError(str(e), response=r)
+
+
+def get_info(obj):
+    """
+    Returns the decoded ``info`` of a payment or refund. Unlike ``info_data``, the result is decoded only once per
+    instance and value of ``info`` and must not be modified.
+    """
+    info = obj.info
+    cached = obj.__dict__.get("_oppwa_info")
+    if cached is not None and cached[0] is info:
+        return cached[1]
+    data = get_codec().loads(info) if info else {}
+    obj._oppwa_info = (info, data)
+    return data
+
+
+def set_info(obj, data):
+    obj.info = get_codec().dumps(data)
+    obj._oppwa_info = (obj.info, data)
@@ -0,0 +1,21 @@
+from django.conf import settings
+
+# Instance-wide options are read from the ``[oppwa]`` section of pretix.cfg (or the matching
+# ``PRETIX_OPPWA_*`` environment variables) and apply to the OPPWA, VR Payment and Hobex plugins alike.
+SECTION = "oppwa"
+
+
+def get(option, fallback=None):
+    return settings.CONFIG_FILE.get(SECTION, option, fallback=fallback)
+
+
+def getint(option, fallback=None):
+    return settings.CONFIG_FILE.getint(SECTION, option, fallback=fallback)
+
+
+def getfloat(option, fallback=None):
+    return settings.CONFIG_FILE.getfloat(SECTION, option, fallback=fallback)
+
+
+def getboolean(option, fallback=False):
+    return settings.CONFIG_FILE.getboolean(SECTION, option, fallback=fallback)
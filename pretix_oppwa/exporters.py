@@ -0,0 +1,112 @@
+from collections import OrderedDict
+from django.db.models import Q
+from django.utils.timezone import now
+from django.utils.translation import gettext_lazy as _, pgettext_lazy
+from pretix.base.exporter import ListExporter
+from pretix.base.models import OrderPayment, OrderRefund
+from pretix.base.timeframes import (
+    DateFrameField, resolve_timeframe_to_datetime_start_inclusive_end_exclusive,
+)
+
+from pretix_oppwa import codec
+from pretix_oppwa.reconcile import BRANDS
+
+# Only these columns are loaded, never the orders or events themselves
+FIELDS = (
+    "order__event__slug", "order__event__currency", "order__code", "local_id", "provider", "state", "amount",
+    "created", "info",
+)
+
+
+class TransactionExporter(ListExporter):
+    identifier = "oppwa_transactions"
+    verbose_name = _("OPPWA, VR Payment and Hobex transactions")
+    category = pgettext_lazy("export_category", "Order data")
+    description = _(
+        "Download the transaction IDs, brands, result codes and descriptors reported by the payment provider for "
+        "all payments and refunds processed through OPPWA, VR Payment or Hobex."
+    )
+    # Number of rows fetched from the database at once
+    chunk_size = 2000
+
+    @property
+    def additional_form_fields(self):
+        return OrderedDict(
+            [
+                (
+                    "date_range",
+                    DateFrameField(
+                        label=_("Date range (start of transaction)"),
+                        include_future_frames=False,
+                        required=False,
+                    ),
+                ),
+            ]
+        )
+
+    def _filter(self, qs, form_data):
+        provider_filter = Q()
+        for brand in BRANDS:
+            provider_filter |= Q(provider__startswith="{}_".format(brand))
+        qs = qs.filter(provider_filter, order__event__in=self.events)
+
+        if form_data.get("date_range"):
+            dt_start, dt_end = resolve_timeframe_to_datetime_start_inclusive_end_exclusive(
+                now(), form_data["date_range"], self.timezone
+            )
+            if dt_start:
+                qs = qs.filter(created__gte=dt_start)
+            if dt_end:
+                qs = qs.filter(created__lt=dt_end)
+        return qs.order_by("pk")
+
+    def _rows(self, qs, kind, sign):
+        for slug, currency, code, local_id, provider, state, amount, created, info in qs.values_list(*FIELDS).iterator(
+            chunk_size=self.chunk_size
+        ):
+            try:
+                data = codec.loads(info) if info else {}
+            except ValueError:
+                data = {}
+            if not isinstance(data, dict):
+                data = {}
+            result = data.get("result") or {}
+            yield [
+                slug,
+                code,
+                "{}-{}-{}".format(code, kind, local_id),
+                provider,
+                created.astimezone(self.timezone).strftime("%Y-%m-%d %H:%M:%S"),
+                state,
+                amount * sign,
+                currency,
+                data.get("id", "") if "paymentType" in data else "",
+                data.get("referencedId", ""),
+                data.get("merchantTransactionId", ""),
+                data.get("paymentType", ""),
+                data.get("paymentBrand", ""),
+                result.get("code", ""),
+                result.get("description", ""),
+                data.get("descriptor", ""),
+                data.get("shortId", ""),
+            ]
+
+    def iterate_list(self, form_data):
+        payments = self._filter(OrderPayment.objects.all(), form_data)
+        refunds = self._filter(OrderRefund.objects.all(), form_data)
+
+        yield [
+            _("Event slug"), _("Order"), _("Payment ID"), _("Payment method"), _("Creation date"), _("Status"),
+            _("Amount"), _("Currency"), _("Transaction ID"), _("Referenced transaction ID"),
+            _("Merchant transaction ID"), _("Payment type"), _("Brand"), _("Result code"), _("Result description"),
+            _("Descriptor"), _("Short ID"),
+        ]
+        yield self.ProgressSetTotal(total=payments.count() + refunds.count())
+        yield from self._rows(payments, "P", 1)
+        yield from self._rows(refunds, "R", -1)
+
+    def get_filename(self):
+        if self.is_multievent:
+            return "{}_oppwa_transactions".format(self.organizer.slug)
+        else:
+            return "{}_oppwa_transactions".format(self.event.slug)
@@ -0,0 +1,94 @@
+from django.utils.module_loading import import_string
+from functools import lru_cache
+from pretix.base.models import OrderPayment, OrderRefund
+
+from pretix_oppwa.models import ReferencedOPPWAObject
+
+# The provider base class of every brand, which defines how the brand builds its merchantTransactionIds
+METHOD_CLASSES = {
+    "oppwa": "pretix_oppwa.payment.OPPWAMethod",
+    "vrpay": "pretix_vrpay.payment.OPPWAMethod",
+    "hobex": "pretix_hobex.payment.OPPWAMethod",
+}
+
+
+@lru_cache(maxsize=None)
+def get_method_class(brand):
+    return import_string(METHOD_CLASSES[brand])
+
+
+def resolve_payments(brand, merchant_transaction_ids, event=None):
+    """
+    Resolves merchantTransactionIds sent to the payment provider back to the payments of ``brand`` they have been
+    built for, optionally only within ``event``. All ids of a batch are narrowed down to a few candidates with a
+    single query on the indexed ``merchant_transaction_id_field`` of the brand, and only candidates whose id
+    matches when it is built again are returned.
+
+    Returns a dictionary mapping the ids to their payments. Ids that can not be resolved are left out.
+    """
+    cls = get_method_class(brand)
+    merchant_transaction_ids = set(merchant_transaction_ids)
+
+    keys = {cls.parse_merchant_transaction_id(m) for m in merchant_transaction_ids} - {None}
+    if not keys:
+        return {}
+
+    qs = OrderPayment.objects.filter(
+        provider__startswith="{}_".format(brand),
+        **{"{}__in".format(cls.merchant_transaction_id_field): keys},
+    )
+    if event is not None:
+        qs = qs.filter(order__event=event).select_related("order")
+    else:
+        qs = qs.select_related("order", "order__event")
+
+    providers = {}
+    result = {}
+    for payment in qs:
+        if event is not None:
+            # Share the settings already loaded for the event
+            payment.order.event = event
+        pprov = providers.get(payment.order.event_id)
+        if pprov is None:
+            pprov = providers[payment.order.event_id] = cls(payment.order.event)
+        merchant_transaction_id = pprov.get_merchant_transaction_id(payment)
+        if merchant_transaction_id in merchant_transaction_ids:
+            result[merchant_transaction_id] = payment
+    return result
+
+
+def resolve_payment(brand, merchant_transaction_id, event=None):
+    """
+    Returns the payment of ``brand`` that ``merchant_transaction_id`` has been built for, or ``None``.
+    """
+    return resolve_payments(brand, [merchant_transaction_id], event).get(merchant_transaction_id)
+
+
+def reference_transaction(obj, transaction_id):
+    """
+    Records that the payment provider reported the transaction ``transaction_id`` for the payment or refund
+    ``obj``, so that ``resolve_transactions`` finds it.
+    """
+    if isinstance(obj, OrderRefund):
+        ReferencedOPPWAObject.objects.create(reference=transaction_id, refund=obj)
+    else:
+        ReferencedOPPWAObject.objects.create(reference=transaction_id, payment=obj)
+
+
+def resolve_transactions(brand, transaction_ids, refunds=False):
+    """
+    Resolves transaction ids reported by the payment provider back to the payments of ``brand``, or its refunds if
+    ``refunds`` is set, through a single query on the indexed references recorded by ``reference_transaction``.
+
+    Returns a dictionary mapping the ids to their payments or refunds. Ids that can not be resolved are left out.
+    """
+    transaction_ids = set(transaction_ids)
+    if not transaction_ids:
+        return {}
+
+    field = "refund" if refunds else "payment"
+    qs = ReferencedOPPWAObject.objects.filter(
+        reference__in=transaction_ids,
+        **{"{}__provider__startswith".format(field): "{}_".format(brand)},
+    ).select_related(field, "{}__order".format(field), "{}__order__event".format(field))
+    return {ref.reference: getattr(ref, field) for ref in qs}
@@ -0,0 +1,175 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+from pretix.base.models import Event, Order, OrderPayment
+from pretix.multidomain.urlreverse import build_absolute_uri
+from urllib.parse import urlsplit
+
+from pretix_oppwa import conf
+from pretix_oppwa.reconcile import BRANDS
+
+STEPS = ("pay", "return", "notify")
+# Notifications are answered with a plain "OK" if they are processed asynchronously
+EXPECTED_STATUS = {"pay": (200,), "return": (302,), "notify": (200, 302)}
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of the sorted list ``values``.
+    """
+    if not values:
+        return 0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the pay, return and notify steps of many test mode payments concurrently against the local OPPWA "
+        "stand-in (see oppwa_standin) and report throughput and latency percentiles per brand and step"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--event", type=int, required=True, help="ID of the event to create test orders in")
+        parser.add_argument(
+            "--brand", action="append", dest="brands", choices=BRANDS,
+            help="Brand to benchmark, can be given multiple times (default: all with credit cards enabled)",
+        )
+        parser.add_argument("--payments", type=int, default=100, help="Number of payments per brand")
+        parser.add_argument("--concurrency", type=int, default=10, help="Number of payments processed in parallel")
+        parser.add_argument("--keep", action="store_true", help="Do not delete the test orders afterwards")
+
+    def handle(self, *args, **options):
+        if not conf.get("test_endpoint_url"):
+            raise CommandError(
+                "Please set test_endpoint_url in the [oppwa] section of pretix.cfg to the address of the OPPWA "
+                "stand-in, the benchmark must not be run against the payment provider's test system."
+            )
+
+        with scopes_disabled():
+            try:
+                event = Event.objects.select_related("organizer").get(pk=options["event"])
+            except Event.DoesNotExist:
+                raise CommandError("Event not found.")
+
+            providers = event.get_payment_providers()
+            for brand in options["brands"] or BRANDS:
+                pprov = providers.get("{}_scheme".format(brand))
+                if not pprov or not pprov.is_enabled or not pprov.get_entity_id(True):
+                    if options["brands"]:
+                        self.stderr.write(
+                            "Skipping {}: credit cards are not enabled with an entity for the test endpoint.".format(
+                                brand
+                            )
+                        )
+                    continue
+
+                payments = self._create_payments(event, pprov, options["payments"])
+                try:
+                    self._run(brand, payments, options["concurrency"])
+                finally:
+                    if not options["keep"]:
+                        for payment in payments:
+                            payment.order.gracefully_delete()
+
+    def _create_payments(self, event, pprov, count):
+        sales_channel = "web"
+        if Order._meta.get_field("sales_channel").is_relation:
+            sales_channel = event.organizer.sales_channels.get(identifier="web")
+
+        payments = []
+        for _ in range(count):
+            with transaction.atomic():
+                order = Order.objects.create(
+                    event=event,
+                    status=Order.STATUS_PENDING,
+                    testmode=True,
+                    datetime=now(),
+                    expires=now() + timedelta(days=1),
+                    total=Decimal("10.00"),
+                    locale="en",
+                    sales_channel=sales_channel,
+                )
+                order.create_transactions()
+                payments.append(order.payments.create(
+                    provider=pprov.identifier,
+                    amount=order.total,
+                    state=OrderPayment.PAYMENT_STATE_CREATED,
+                ))
+        return payments
+
+    def _url(self, payment, brand, step):
+        tag = "plugins:pretix_{}:{}".format(brand, step)
+        url = urlsplit(build_absolute_uri(
+            payment.order.event,
+            tag,
+            kwargs={
+                "order": payment.order.code,
+                "payment": payment.pk,
+                "hash": payment.order.tagged_secret(tag),
+                "payment_provider": brand,
+            },
+        ))
+        return url.path, {"HTTP_HOST": url.netloc, "secure": url.scheme == "https"}
+
+    def _run(self, brand, payments, concurrency):
+        timings = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+        local = threading.local()
+
+        def request(step, payment, data=None):
+            if not hasattr(local, "client"):
+                local.client = Client()
+            path, extra = self._url(payment, brand, step)
+            start = time.perf_counter()
+            response = local.client.get(path, data, **extra)
+            duration = time.perf_counter() - start
+            with lock:
+                timings[step].append(duration)
+                if response.status_code not in EXPECTED_STATUS[step]:
+                    errors[step] += 1
+            return response
+
+        def flow(payment):
+            with scopes_disabled():
+                request("pay", payment)
+                payment.refresh_from_db(fields=["info"])
+                if "id" not in payment.info_data:
+                    return
+                data = {"resourcePath": "/v1/checkouts/{}/payment".format(payment.info_data["id"])}
+                request("return", payment, data)
+                request("notify", payment, data)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(flow, payments))
+        duration = time.perf_counter() - start
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            "{}: {} payments in {:.1f}s, {:.1f} payments/s".format(
+                brand, len(payments), duration, len(payments) / duration
+            )
+        ))
+        self.stdout.write("  {:<8} {:>7} {:>7} {:>9} {:>9} {:>9} {:>9}".format(
+            "step", "count", "errors", "p50 ms", "p90 ms", "p99 ms", "max ms"
+        ))
+        for step in STEPS:
+            values = sorted(timings[step])
+            self.stdout.write("  {:<8} {:>7} {:>7} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+                step,
+                len(values),
+                errors[step],
+                percentile(values, 50) * 1000,
+                percentile(values, 90) * 1000,
+                percentile(values, 99) * 1000,
+                (values[-1] if values else 0) * 1000,
+            ))
@@ -0,0 +1,124 @@
+import timeit
+from django.core.management.base import BaseCommand
+
+from pretix_oppwa import codec
+
+# Shaped and sized like the responses OPPWA sends for a created checkout, a completed card payment and a refund
+PAYLOADS = {
+    "checkout": {
+        "result": {"code": "000.200.100", "description": "successfully created checkout"},
+        "buildNumber": "c2d1c3a1a7bfc0dc1c7c6d9a3b2e5f0a8d1e4c7b@2024-05-14 09:12:45 +0000",
+        "timestamp": "2024-05-14 10:03:27.512+0000",
+        "ndc": "8E1C5C1F0C1B4E0A8B2E1F7D4A6C9B3E.uat01-vm-tx02",
+        "id": "8E1C5C1F0C1B4E0A8B2E1F7D4A6C9B3E.uat01-vm-tx02",
+    },
+    "payment": {
+        "id": "8ac7a4a18f6d1c2e018f6e5b7a3d4c21",
+        "paymentType": "DB",
+        "paymentBrand": "VISA",
+        "amount": "149.90",
+        "currency": "EUR",
+        "descriptor": "3284.1234.5678 BIGFEST-ABC12-P-1 Big Festival 2024",
+        "merchantTransactionId": "BIGFEST-ABC12-P-1",
+        "result": {
+            "code": "000.100.110",
+            "description": "Request successfully processed in 'Merchant in Integrator Test Mode'",
+        },
+        "resultDetails": {
+            "ExtendedDescription": "Approved",
+            "clearingInstituteName": "Example Clearing Institute",
+            "ConnectorTxID1": "8ac7a4a18f6d1c2e018f6e5b7a3d4c21",
+            "ConnectorTxID3": "123456789012345",
+            "connectorId": "123456789012",
+            "AcquirerResponse": "00",
+            "reconciliationId": "4f0e1b2c3d4e5f60718293a4b5c6d7e8",
+        },
+        "card": {
+            "bin": "420000",
+            "binCountry": "DE",
+            "last4Digits": "0000",
+            "holder": "Jane Jones",
+            "expiryMonth": "05",
+            "expiryYear": "2034",
+            "issuer": {"bank": "Example Bank AG", "country": "DE"},
+            "type": "CREDIT",
+            "level": "CLASSIC",
+        },
+        "customer": {
+            "email": "jane.jones@example.org",
+            "ip": "192.0.2.10",
+            "ipCountry": "DE",
+            "browserFingerprint": {"value": "0400bpNfiPCR/AUNf94lis1ztioT9A1DShgAnrp/XmcfWoVVgr+Rt2dAZPhMS97Z"},
+        },
+        "billing": {
+            "street1": "Berliner Strasse 1",
+            "city": "Heidelberg",
+            "postcode": "69117",
+            "country": "DE",
+        },
+        "threeDSecure": {
+            "eci": "05",
+            "verificationId": "MTIzNDU2Nzg5MDEyMzQ1Njc4OTA=",
+            "version": "2.2.0",
+            "dsTransactionId": "c5b808e7-1de1-4069-a17b-f70d3b3b1645",
+            "challengeMandatedIndicator": "N",
+            "transactionStatusReason": "01",
+            "acsTransactionId": "e6d7f5a2-3c4b-4d5e-8f9a-0b1c2d3e4f50",
+            "cardHolderInfo": "",
+            "authType": "01",
+            "flow": "frictionless",
+        },
+        "customParameters": {
+            "SHOPPER_EndToEndIdentity": "4a2d6f8b0c1e3a5b7d9f1e3c5a7b9d1f3e5a7c9b1d3f5e7a9c1b3d5f7e9a1c3b",
+            "CTPE_DESCRIPTOR_TEMPLATE": "",
+            "StandingInstructionAPI": "false",
+        },
+        "risk": {"score": "100"},
+        "buildNumber": "c2d1c3a1a7bfc0dc1c7c6d9a3b2e5f0a8d1e4c7b@2024-05-14 09:12:45 +0000",
+        "timestamp": "2024-05-14 10:05:02.741+0000",
+        "ndc": "8E1C5C1F0C1B4E0A8B2E1F7D4A6C9B3E.uat01-vm-tx02",
+        "source": "OPP",
+        "paymentMethod": "CC",
+        "shortId": "1234.5678.9012",
+    },
+    "refund": {
+        "id": "8ac7a49f8f6d1c2e018f6e7c1b2a3d44",
+        "referencedId": "8ac7a4a18f6d1c2e018f6e5b7a3d4c21",
+        "paymentType": "RF",
+        "amount": "149.90",
+        "currency": "EUR",
+        "descriptor": "3284.1234.9999 BIGFEST-ABC12-P-1 Big Festival 2024",
+        "result": {
+            "code": "000.100.110",
+            "description": "Request successfully processed in 'Merchant in Integrator Test Mode'",
+        },
+        "resultDetails": {"ConnectorTxID1": "8ac7a49f8f6d1c2e018f6e7c1b2a3d44", "AcquirerResponse": "00"},
+        "buildNumber": "c2d1c3a1a7bfc0dc1c7c6d9a3b2e5f0a8d1e4c7b@2024-05-14 09:12:45 +0000",
+        "timestamp": "2024-05-14 11:41:19.093+0000",
+        "ndc": "8a8294174b7ecb28014b9699220015ca_4a4c6f4a3b5e4d8c9a1f2b3c4d5e6f70",
+    },
+}
+
+
+class Command(BaseCommand):
+    help = "Compare the speed of the available JSON codecs on payloads shaped like those of OPPWA"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20000)
+
+    def handle(self, *args, **options):
+        codecs = {"json": codec.StdlibCodec}
+        if codec.orjson is not None:
+            codecs["orjson"] = codec.OrjsonCodec
+
+        self.stdout.write("Configured codec: {}".format(codec.get_codec().__name__))
+        self.stdout.write("{:<10} {:>7} {:<8} {:>12} {:>12}".format("payload", "bytes", "codec", "loads µs", "dumps µs"))
+        n = options["iterations"]
+        for name, payload in PAYLOADS.items():
+            raw = codec.StdlibCodec.dumps(payload).encode()
+            for codec_name, c in codecs.items():
+                loads = timeit.timeit(lambda: c.loads(raw), number=n) / n * 1e6
+                dumps = timeit.timeit(lambda: c.dumps(payload), number=n) / n * 1e6
+                self.stdout.write("{:<10} {:>7} {:<8} {:>12.2f} {:>12.2f}".format(
+                    name, len(raw), codec_name, loads, dumps
+                ))
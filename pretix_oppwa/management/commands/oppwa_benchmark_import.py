@@ -0,0 +1,49 @@
+import os
+import re
+import subprocess
+import sys
+import time
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+MODULES = ("pretix_oppwa.paymentmethods", "pretix_vrpay.paymentmethods", "pretix_hobex.paymentmethods")
+
+SCRIPT = "import django; django.setup(); import {}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure how long importing the payment method modules of all brands takes in a fresh interpreter, and "
+        "how long generating their provider classes takes on first use"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5, help="Number of fresh interpreters, the best is reported")
+
+    def _import_times(self):
+        # python -X importtime writes "import time: <self> | <cumulative> | <module>" for every module to stderr
+        r = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", SCRIPT.format(", ".join(MODULES))],
+            env=dict(os.environ), capture_output=True, text=True, check=True,
+        )
+        times = {}
+        for line in r.stderr.splitlines():
+            m = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S+)$", line)
+            if m and m.group(2) in MODULES:
+                times.setdefault(m.group(2), int(m.group(1)))
+        return times
+
+    def handle(self, *args, **options):
+        runs = [self._import_times() for _ in range(options["repeat"])]
+
+        self.stdout.write("{:<30} {:>12} {:>14} {:>8}".format("module", "import µs", "classes µs", "classes"))
+        for module in MODULES:
+            lazy = import_string("{}.payment_method_classes".format(module))
+            # A new instance, as pretix might already have asked this one for the providers
+            classes = type(lazy)(*lazy.args)
+            t = time.perf_counter()
+            generated = classes()
+            duration = (time.perf_counter() - t) * 1e6
+            self.stdout.write("{:<30} {:>12} {:>14.0f} {:>8}".format(
+                module, min(r.get(module, 0) for r in runs), duration, len(generated)
+            ))
@@ -0,0 +1,39 @@
+import re
+import timeit
+from django.core.management.base import BaseCommand
+
+from pretix_oppwa import results
+
+# One code of every category, and a rejected one that has to be checked against every pattern
+CODES = ["000.000.000", "000.100.110", "000.400.000", "000.200.000", "800.400.500", "800.100.151", "100.396.101"]
+
+
+def classify_uncompiled(code):
+    # The classification process_result did before pretix_oppwa.results existed, compiling the patterns per call
+    if re.compile(r"^(000\.000\.|000\.100\.1|000\.[36])").match(code):
+        return results.SUCCESS
+    elif re.compile(r"^(000\.400\.0[^3]|000\.400\.100)").match(code):
+        return results.REVIEW
+    elif re.compile(r"^(000\.200)").match(code):
+        return results.PENDING
+    elif re.compile(r"^(800\.400\.5|100\.400\.500)").match(code):
+        return results.PENDING_LONG
+    return results.REJECTED
+
+
+class Command(BaseCommand):
+    help = "Compare the speed of classifying OPPWA result codes with the separate patterns and the shared table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=200000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        for code in CODES:
+            if classify_uncompiled(code) != results.classify(code):
+                self.stderr.write("Results differ for {}".format(code))
+
+        n = options["iterations"] // len(CODES)
+        for name, fn in (("uncompiled", classify_uncompiled), ("table", results.classify)):
+            t = min(timeit.repeat(lambda: [fn(c) for c in CODES], number=n, repeat=options["repeat"]))
+            self.stdout.write("{:<12} {:>10.0f} ns per result code".format(name, t / (n * len(CODES)) * 1e9))
@@ -0,0 +1,60 @@
+import csv
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django_scopes import scopes_disabled
+
+from pretix_oppwa.reconcile import BRANDS
+from pretix_oppwa.settlement import (
+    REPORT_FIELDS, SettlementImporter, iter_csv_records, iter_json_records,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Match the transactions of an OPPWA, VR Payment or Hobex settlement report (CSV or JSON) to payments and "
+        "refunds, process the results of those still pending and report all discrepancies"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="Settlement report")
+        parser.add_argument("--brand", choices=BRANDS, default="oppwa", help="Brand the report has been issued by")
+        parser.add_argument("--format", choices=("auto", "csv", "json"), default="auto", help="Format of the report")
+        parser.add_argument("--report", default=None, help="Write discrepancies to this CSV file instead of stdout")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Number of transactions matched at once")
+        parser.add_argument("--dry-run", action="store_true", help="Only report, do not process any results")
+
+    def handle(self, *args, **options):
+        fmt = options["format"]
+        if fmt == "auto":
+            fmt = "json" if options["file"].lower().endswith((".json", ".jsonl", ".ndjson")) else "csv"
+
+        def progress(stats):
+            if options["verbosity"] > 1:
+                self.stderr.write(
+                    "{} rows: {}".format(
+                        stats["rows"],
+                        ", ".join("{}={}".format(k, v) for k, v in sorted(stats.items()) if k != "rows"),
+                    )
+                )
+
+        report_file = open(options["report"], "w", newline="", encoding="utf-8") if options["report"] else sys.stdout
+        try:
+            report = csv.DictWriter(report_file, fieldnames=REPORT_FIELDS)
+            report.writeheader()
+
+            with open(options["file"], newline="", encoding="utf-8-sig") as f, scopes_disabled():
+                records = iter_json_records(f) if fmt == "json" else iter_csv_records(f)
+                importer = SettlementImporter(
+                    options["brand"], report=report, chunk_size=options["chunk_size"], dry_run=options["dry_run"]
+                )
+                try:
+                    stats = importer.run(records, progress=progress)
+                except (ValueError, csv.Error) as e:
+                    raise CommandError("Could not read {}: {}".format(options["file"], e))
+        finally:
+            if report_file is not sys.stdout:
+                report_file.close()
+
+        self.stderr.write(self.style.SUCCESS("Done, {} rows: {}".format(
+            stats["rows"], ", ".join("{}={}".format(k, v) for k, v in sorted(stats.items()) if k != "rows")
+        )))
@@ -0,0 +1,46 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django_scopes import scopes_disabled
+
+from pretix_oppwa.reconcile import pending_payments, reconcile_payments
+
+
+class Command(BaseCommand):
+    help = "Query the status of all pending OPPWA, VR Payment and Hobex payments and process the results"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=8, help="Number of parallel status requests")
+        parser.add_argument("--rate", type=float, default=None, help="Maximum number of status requests per second")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Number of payments loaded at once")
+        parser.add_argument("--limit", type=int, default=None, help="Maximum number of payments to check")
+        parser.add_argument("--min-age", type=int, default=45, help="Skip payments younger than this (minutes)")
+        parser.add_argument("--max-age", type=int, default=30, help="Skip payments older than this (days)")
+        parser.add_argument("--event", type=int, default=None, help="Only check payments of the event with this ID")
+
+    def handle(self, *args, **options):
+        def progress(stats):
+            if options["verbosity"] > 0:
+                self.stdout.write(
+                    "{} checked: {}".format(
+                        stats["checked"],
+                        ", ".join("{}={}".format(k, v) for k, v in sorted(stats.items()) if k != "checked"),
+                    )
+                )
+
+        with scopes_disabled():
+            qs = pending_payments(
+                min_age=timedelta(minutes=options["min_age"]),
+                max_age=timedelta(days=options["max_age"]),
+            )
+            if options["event"]:
+                qs = qs.filter(order__event_id=options["event"])
+
+            stats = reconcile_payments(
+                qs,
+                concurrency=options["concurrency"],
+                rate=options["rate"],
+                chunk_size=options["chunk_size"],
+                limit=options["limit"],
+                progress=progress,
+            )
+        self.stdout.write(self.style.SUCCESS("Done, {} payments checked.".format(stats["checked"])))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django_scopes import scopes_disabled
+
+from pretix_oppwa.refunds import execute_refunds, pending_refunds
+
+
+class Command(BaseCommand):
+    help = "Send all OPPWA, VR Payment and Hobex refunds that have not been sent yet and process the results"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=8, help="Number of parallel refund requests")
+        parser.add_argument(
+            "--rate", type=float, default=None, help="Maximum number of refund requests per second and entity"
+        )
+        parser.add_argument("--retries", type=int, default=3, help="Number of retries if a request could not be sent")
+        parser.add_argument("--backoff", type=float, default=1.0, help="Initial delay between retries (seconds)")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Number of refunds loaded at once")
+        parser.add_argument("--limit", type=int, default=None, help="Maximum number of refunds to send")
+        parser.add_argument("--event", type=int, default=None, help="Only send refunds of the event with this ID")
+
+    def handle(self, *args, **options):
+        def progress(stats):
+            if options["verbosity"] > 0:
+                self.stdout.write(
+                    "{} checked: {}".format(
+                        stats["checked"],
+                        ", ".join("{}={}".format(k, v) for k, v in sorted(stats.items()) if k != "checked"),
+                    )
+                )
+
+        with scopes_disabled():
+            qs = pending_refunds()
+            if options["event"]:
+                qs = qs.filter(order__event_id=options["event"])
+
+            stats = execute_refunds(
+                qs,
+                concurrency=options["concurrency"],
+                rate=options["rate"],
+                retries=options["retries"],
+                backoff=options["backoff"],
+                chunk_size=options["chunk_size"],
+                limit=options["limit"],
+                progress=progress,
+            )
+        if stats["unknown"]:
+            self.stdout.write(self.style.WARNING(
+                "{} refunds have been sent without a response and need to be checked manually.".format(stats["unknown"])
+            ))
+        self.stdout.write(self.style.SUCCESS("Done, {} refunds checked.".format(stats["checked"])))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from pretix_oppwa.standin import StandInGateway, make_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local stand-in for the OPPWA API. Point test mode payments to it by setting test_endpoint_url in the "
+        "[oppwa] section of pretix.cfg to the address it is listening on."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8899)
+        parser.add_argument("--latency", type=int, default=0, help="Delay of every response (milliseconds)")
+        parser.add_argument("--jitter", type=int, default=0, help="Maximum random additional delay (milliseconds)")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with HTTP 500")
+        parser.add_argument("--drop-rate", type=float, default=0.0, help="Share of requests left unanswered")
+        parser.add_argument(
+            "--result-code", action="append", dest="result_codes",
+            help="Result code of payments, picked at random if given multiple times (default: 000.100.110)",
+        )
+        parser.add_argument(
+            "--refund-result-code", action="append", dest="refund_result_codes",
+            help="Result code of refunds, picked at random if given multiple times (default: 000.100.110)",
+        )
+
+    def handle(self, *args, **options):
+        gateway = StandInGateway(
+            latency=options["latency"] / 1000,
+            jitter=options["jitter"] / 1000,
+            error_rate=options["error_rate"],
+            drop_rate=options["drop_rate"],
+            result_codes=options["result_codes"] or ("000.100.110",),
+            refund_result_codes=options["refund_result_codes"] or ("000.100.110",),
+        )
+        server = make_server(options["host"], options["port"], gateway)
+        self.stdout.write("OPPWA stand-in listening on http://{}:{}/".format(*server.server_address[:2]))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
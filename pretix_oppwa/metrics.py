@@ -0,0 +1,168 @@
+import re
+import requests
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from django.conf import settings
+from django.utils.module_loading import import_string
+from urllib.parse import urlsplit
+
+from pretix_oppwa import conf
+
+_backend = None
+_backend_loaded = False
+_backend_lock = threading.Lock()
+_in_flight = defaultdict(int)
+_in_flight_lock = threading.Lock()
+
+_operations = [
+    ("POST", re.compile(r"^/v[0-9]+/checkouts$"), "create_checkout"),
+    ("GET", re.compile(r"^/v[0-9]+/checkouts/[^/]+/payment$"), "checkout_status"),
+    ("GET", re.compile(r"^/v[0-9]+/query/"), "query"),
+    ("POST", re.compile(r"^/v[0-9]+/payments/"), "refund"),
+]
+
+
+class MetricsBackend:
+    """
+    Receives measurements of all calls to the payment provider's API and all processed results. Custom backends
+    inherit from this class, override any of the methods and are configured through the ``metrics_backend``
+    option in the ``[oppwa]`` section of pretix.cfg.
+    """
+
+    def request_started(self, brand, endpoint, operation, in_flight, pool_size):
+        """
+        Called before a request is sent. ``in_flight`` is the number of requests of this process currently waiting
+        for the same endpoint, including this one; ``pool_size`` is the number of connections kept open to it.
+        """
+
+    def request_finished(self, brand, endpoint, operation, duration, outcome):
+        """
+        Called after a request has completed or failed. ``outcome`` is one of ``ok``, ``http_error``,
+        ``timeout`` and ``error``.
+        """
+
+    def result_processed(self, brand, kind, category):
+        """
+        Called for every result passed to ``process_result``, ``kind`` being ``payment`` or ``refund`` and
+        ``category`` one of the categories of ``pretix_oppwa.results``.
+        """
+
+
+class PretixMetricsBackend(MetricsBackend):
+    """
+    Records all measurements with pretix' own metrics, which are exposed in the Prometheus format by pretix'
+    ``/metrics`` endpoint.
+    """
+
+    def __init__(self):
+        from pretix.base.metrics import Counter, Gauge, Histogram
+
+        self.request_duration = Histogram(
+            "pretix_oppwa_request_duration_seconds", "Duration of calls to the payment provider",
+            ["brand", "endpoint", "operation"],
+            buckets=[.05, .1, .25, .5, .75, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf")],
+        )
+        self.request_errors = Counter(
+            "pretix_oppwa_request_errors_total", "Failed calls to the payment provider",
+            ["brand", "endpoint", "operation", "outcome"],
+        )
+        self.requests_in_flight = Gauge(
+            "pretix_oppwa_requests_in_flight", "Calls to the payment provider currently waiting for a response",
+            ["brand", "endpoint"],
+        )
+        self.pool_exhausted = Counter(
+            "pretix_oppwa_pool_exhausted_total", "Calls to the payment provider that found all pooled connections busy",
+            ["brand", "endpoint"],
+        )
+        self.results = Counter(
+            "pretix_oppwa_results_total", "Results processed, by category",
+            ["brand", "kind", "category"],
+        )
+
+    def request_started(self, brand, endpoint, operation, in_flight, pool_size):
+        self.requests_in_flight.inc(brand=brand, endpoint=endpoint)
+        if in_flight > pool_size:
+            self.pool_exhausted.inc(brand=brand, endpoint=endpoint)
+
+    def request_finished(self, brand, endpoint, operation, duration, outcome):
+        self.requests_in_flight.dec(brand=brand, endpoint=endpoint)
+        self.request_duration.observe(duration, brand=brand, endpoint=endpoint, operation=operation)
+        if outcome != "ok":
+            self.request_errors.inc(brand=brand, endpoint=endpoint, operation=operation, outcome=outcome)
+
+    def result_processed(self, brand, kind, category):
+        self.results.inc(brand=brand, kind=kind, category=category)
+
+
+def get_backend():
+    """
+    Returns the configured metrics backend, or ``None`` if metrics are disabled. Without a ``metrics_backend``
+    option, measurements are recorded with pretix' own metrics if they are enabled.
+    """
+    global _backend, _backend_loaded
+
+    if _backend_loaded:
+        return _backend
+
+    with _backend_lock:
+        if not _backend_loaded:
+            path = conf.get("metrics_backend")
+            if path:
+                _backend = import_string(path)()
+            elif settings.METRICS_ENABLED:
+                _backend = PretixMetricsBackend()
+            _backend_loaded = True
+    return _backend
+
+
+def get_operation(method, url):
+    path = urlsplit(url).path
+    for op_method, pattern, name in _operations:
+        if method.upper() == op_method and pattern.match(path):
+            return name
+    return "other"
+
+
+class Call:
+    __slots__ = ("status",)
+
+    def __init__(self):
+        self.status = None
+
+
+@contextmanager
+def track_request(backend, brand, method, url, pool_size):
+    """
+    Reports the duration and outcome of the request performed within the block to ``backend``. The block should
+    store the HTTP status code of the response in the ``status`` attribute of the yielded object.
+    """
+    endpoint = urlsplit(url).hostname
+    operation = get_operation(method, url)
+    key = (brand, endpoint)
+    with _in_flight_lock:
+        _in_flight[key] += 1
+        in_flight = _in_flight[key]
+    backend.request_started(brand, endpoint, operation, in_flight, pool_size)
+
+    call = Call()
+    outcome = "error"
+    start = time.perf_counter()
+    try:
+        yield call
+        outcome = "http_error" if call.status is not None and call.status >= 500 else "ok"
+    except requests.exceptions.Timeout:
+        outcome = "timeout"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        with _in_flight_lock:
+            _in_flight[key] -= 1
+        backend.request_finished(brand, endpoint, operation, duration, outcome)
+
+
+def result_processed(brand, kind, category):
+    backend = get_backend()
+    if backend is not None:
+        backend.result_processed(brand, kind, category)
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('pretixbase', '0277_alter_customer_locale_alter_user_locale'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferencedOPPWAObject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('reference', models.CharField(db_index=True, max_length=190)),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='pretixbase.orderpayment')),
+                ('refund', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='pretixbase.orderrefund')),
+            ],
+        ),
+    ]
@@ -0,0 +1,52 @@
+import json
+from django.db import migrations
+from django.db.models import Q
+
+BRANDS = ("oppwa", "vrpay", "hobex")
+REFUND_TYPES = ("RF", "RV")
+
+
+def _transaction_id(info, refund):
+    try:
+        data = json.loads(info)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or "id" not in data or "paymentType" not in data:
+        return None
+    # Refunds sent through execute_refund carry the info of their payment
+    if (data["paymentType"] in REFUND_TYPES) != refund:
+        return None
+    return data["id"]
+
+
+def reference_transactions(apps, schema_editor):
+    OrderPayment = apps.get_model("pretixbase", "OrderPayment")
+    OrderRefund = apps.get_model("pretixbase", "OrderRefund")
+    ReferencedOPPWAObject = apps.get_model("pretix_oppwa", "ReferencedOPPWAObject")
+
+    provider_filter = Q()
+    for brand in BRANDS:
+        provider_filter |= Q(provider__startswith="{}_".format(brand))
+
+    for model, field in ((OrderPayment, "payment_id"), (OrderRefund, "refund_id")):
+        batch = []
+        qs = model.objects.filter(provider_filter, info__contains='"paymentType"').values_list("pk", "info")
+        for pk, info in qs.iterator(chunk_size=2000):
+            transaction_id = _transaction_id(info, model is OrderRefund)
+            if transaction_id:
+                batch.append(ReferencedOPPWAObject(reference=transaction_id, **{field: pk}))
+            if len(batch) >= 2000:
+                ReferencedOPPWAObject.objects.bulk_create(batch)
+                batch = []
+        ReferencedOPPWAObject.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretix_oppwa", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(reference_transactions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,11 @@
+from django.db import models
+
+
+class ReferencedOPPWAObject(models.Model):
+    """
+    Transaction id reported by the payment provider for a payment or refund, so that settlement reports can be
+    matched without searching the ``info`` of all payments and refunds.
+    """
+    reference = models.CharField(max_length=190, db_index=True)
+    payment = models.ForeignKey("pretixbase.OrderPayment", null=True, blank=True, on_delete=models.CASCADE)
+    refund = models.ForeignKey("pretixbase.OrderRefund", null=True, blank=True, on_delete=models.CASCADE)
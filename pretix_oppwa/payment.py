@@ -1,34 +1,67 @@
 import hashlib
-import importlib
-import json
 import logging
 import re
 import requests
+import time
 from collections import OrderedDict
+from datetime import timedelta
 from decimal import Decimal
 from django import forms
 from django.core import signing
+from django.core.cache import cache
+from django.core.validators import RegexValidator
 from django.db import transaction
 from django.http import HttpRequest
 from django.template.loader import get_template
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _  # NoQA
-from pretix.base.models import Event, Order, OrderPayment, OrderRefund
+from pretix.base.forms import SecretKeySettingsField
+from pretix.base.models import Event, Order, OrderPayment, OrderRefund, Quota
 from pretix.base.payment import (
     BasePaymentProvider, PaymentException, WalletQueries,
 )
 from pretix.base.settings import SettingsSandbox
 from pretix.multidomain.urlreverse import build_absolute_uri, eventreverse
+from urllib.parse import urlencode
+
+from pretix_oppwa import circuit, codec, conf, metrics, results
+from pretix_oppwa.client import get_session
+from pretix_oppwa.lookup import reference_transaction
+from pretix_oppwa.providerconfig import get_provider_config
+from pretix_oppwa.singleflight import single_flight
 
 logger = logging.getLogger("pretix_oppwa")
 
+# Result code of a successfully created checkout
+CHECKOUT_CREATED_CODE = "000.200.100"
+# Payment types of the transactions created by refunds and reversals
+REFUND_PAYMENT_TYPES = ("RF", "RV")
+# OPPWA invalidates checkouts 30 minutes after their creation. We stop reusing them a bit earlier, so that
+# customers have enough time to actually complete the payment form.
+CHECKOUT_VALIDITY_SECONDS = 30 * 60
+CHECKOUT_REUSE_SECONDS = 20 * 60
+# Checkouts created in the background are handed to waiting pay pages through the cache for this long; later
+# requests find them in the payment's info.
+CHECKOUT_HANDOVER_SECONDS = 15
+# The state of a payment is served to polling pending pages from the cache for this long
+PAYMENT_STATUS_CACHE_SECONDS = 10
+# Payments in these states are not changed by any result OPPWA might report
+FINAL_PAYMENT_STATES = (
+    OrderPayment.PAYMENT_STATE_CONFIRMED,
+    OrderPayment.PAYMENT_STATE_REFUNDED,
+)
+
+
+def payment_status_cache_key(payment_id, secret):
+    return "pretix_oppwa:paymentstatus:{}:{}".format(payment_id, hashlib.sha1(secret.encode()).hexdigest())
+
 
 class OPPWASettingsHolder(BasePaymentProvider):
     identifier = "oppwa_settings"
     verbose_name = _("OPPWA")
     is_enabled = False
     is_meta = True
-    payment_methods_settingsholder = []
+    payment_methods = None
     unique_entity_id = True
     baseURLs = ["https://test.oppwa.com/", "https://www.oppwa.com/"]  # noqa
 
@@ -70,16 +103,104 @@ class OPPWASettingsHolder(BasePaymentProvider):
                     required=False,
                 ),
             ),
+            (
+                "webhook_secret",
+                SecretKeySettingsField(
+                    label=_("Webhook secret"),
+                    help_text=_(
+                        "Optional. If you set up a webhook for payments in your merchant account, enter its secret "
+                        "here and use the following URL: {url}"
+                    ).format(
+                        url=build_absolute_uri(
+                            self.event,
+                            "plugins:pretix_{}:webhook".format(self.identifier.split("_")[0]),
+                            kwargs={"payment_provider": self.identifier.split("_")[0]},
+                        )
+                    ),
+                    validators=[
+                        RegexValidator(
+                            "^[0-9a-fA-F]{64}$", _("The secret should consist of 64 hexadecimal characters.")
+                        ),
+                    ],
+                    required=False,
+                ),
+            ),
         ]
 
         d = OrderedDict(
             fields
-            + self.payment_methods_settingsholder
+            + self.get_method_form_fields()
             + list(super().settings_form_fields.items())
         )
         d.move_to_end("_enabled", last=False)
         return d
 
+    @classmethod
+    def get_method_form_fields(cls):
+        """
+        Form fields to enable and configure the individual payment methods of the brand. They are only built
+        when the settings page is first shown in a process.
+        """
+        if "_method_form_fields" not in cls.__dict__:
+            cls._method_form_fields = cls._build_method_form_fields()
+        return cls._method_form_fields
+
+    @classmethod
+    def _build_method_form_fields(cls):
+        brand = cls.identifier.split("_")[0]
+        fields = []
+        for m in cls.payment_methods:
+            if m.retired:
+                continue
+
+            # We do not want meta methods like "scheme" in the settings holder
+            if m.type == "meta":
+                continue
+            fields.append(
+                (
+                    "method_{}".format(m.method),
+                    forms.BooleanField(
+                        label="{} {}".format(
+                            (
+                                '<span class="fa fa-credit-card"></span>'
+                                if m.type == "scheme"
+                                else ""
+                            ),
+                            m.verbose_name,
+                        ),
+                        help_text=m.help_text,
+                        required=False,
+                    ),
+                )
+            )
+            if m.baseclass:
+                for field in m.baseclass.extra_form_fields:
+                    fields.append(
+                        ("method_{}_{}".format(m.method, field[0]), field[1])
+                    )
+
+            # All payment methods except the meta-Type "scheme" get their own EntityId Input
+            # If there is only a single, unique EntityId, we skip this, too.
+            if not cls.unique_entity_id and m.type != "scheme":
+                fields.append(
+                    (
+                        "entityId_{}".format(m.method),
+                        forms.CharField(
+                            label="{} ({})".format(_("Entity ID"), m.verbose_name),
+                            required=False,
+                            widget=forms.TextInput(
+                                attrs={
+                                    "data-display-dependency": "#id_payment_{brand}_method_{method}".format(
+                                        brand=brand,
+                                        method=m.method,
+                                    )
+                                }
+                            ),
+                        ),
+                    ),
+                )
+        return fields
+
 
 class OPPWAMethod(BasePaymentProvider):
     identifier = ""
@@ -87,6 +208,11 @@ class OPPWAMethod(BasePaymentProvider):
     type = ""
     retired = False
     additional_head = ""
+    # Registry of all payment methods of the brand, set on the generated provider classes
+    payment_methods = None
+    # Indexed field of OrderPayment identifying the payments a merchantTransactionId might belong to. Order codes
+    # are only unique per organizer and shared by all payments of the order, so candidates need to be confirmed.
+    merchant_transaction_id_field = "order__code"
 
     def __init__(self, event: Event):
         super().__init__(event)
@@ -96,51 +222,43 @@ class OPPWAMethod(BasePaymentProvider):
     def settings_form_fields(self):
         return {}
 
+    @property
+    def config(self):
+        return get_provider_config(self.event, self.identifier.split("_")[0], self.payment_methods)
+
     @property
     def is_enabled(self) -> bool:
         if self.retired:
             return False
 
+        config = self.config
         if self.type == "meta":
-            module = importlib.import_module(
-                __name__.replace("oppwa", self.identifier.split("_")[0]).replace(
-                    ".payment", ".paymentmethods"
-                )
-            )
-            for method in list(
-                filter(lambda d: d["type"] == "scheme", module.payment_methods)
-            ):
-                if self.settings.get("_enabled", as_type=bool) and self.settings.get(
-                    "method_{}".format(method["method"]), as_type=bool
-                ):
-                    return True
-            return False
+            return config.enabled and config.schemes_enabled
         else:
-            return self.settings.get("_enabled", as_type=bool) and self.settings.get(
-                "method_{}".format(self.method), as_type=bool
-            )
+            return config.enabled and self.method in config.methods
 
     def payment_refund_supported(self, payment: OrderPayment) -> bool:
-        if "id" in payment.info_data:
+        if "id" in codec.get_info(payment):
             return True
         return False
 
     def payment_partial_refund_supported(self, payment: OrderPayment) -> bool:
-        if "id" in payment.info_data:
+        if "id" in codec.get_info(payment):
             return True
         return False
 
     def get_endpoint_url(self, testmode):
         if testmode:
-            return "https://test.oppwa.com"
+            return conf.get("test_endpoint_url") or "https://test.oppwa.com"
         else:
             return "https://oppwa.com"
 
     def _init_api(self, testmode):
-        s = requests.Session()
-        s.headers = {"Authorization": "Bearer {}".format(self.settings.access_token)}
-
-        return s
+        return get_session(
+            self.identifier.split("_")[0],
+            self.get_endpoint_url(testmode),
+            self.config.access_token,
+        )
 
     def payment_control_render(self, request: HttpRequest, payment: OrderPayment):
         template = get_template("pretix_oppwa/control.html")
@@ -148,7 +266,7 @@ class OPPWAMethod(BasePaymentProvider):
             "request": request,
             "event": self.event,
             "settings": self.settings,
-            "payment_info": payment.info_data,
+            "payment_info": codec.get_info(payment),
             "order": payment.order,
             "provname": self.verbose_name,
         }
@@ -160,7 +278,7 @@ class OPPWAMethod(BasePaymentProvider):
             "request": request,
             "event": self.event,
             "settings": self.settings,
-            "payment_info": payment.info_data,
+            "payment_info": codec.get_info(payment),
             "order": payment.order,
             "provname": self.verbose_name,
         }
@@ -177,10 +295,7 @@ class OPPWAMethod(BasePaymentProvider):
         return template.render(ctx)
 
     def payment_pending_render(self, request, payment) -> str:
-        if payment.info:
-            payment_info = json.loads(payment.info)
-        else:
-            payment_info = None
+        payment_info = codec.get_info(payment) or None
         template = get_template("pretix_oppwa/pending.html")
         ctx = {
             "request": request,
@@ -191,6 +306,18 @@ class OPPWAMethod(BasePaymentProvider):
             "payment": payment,
             "payment_info": payment_info,
         }
+        if payment.state == OrderPayment.PAYMENT_STATE_PENDING:
+            ident = self.identifier.split("_")[0]
+            ctx["status_url"] = eventreverse(
+                self.event,
+                "plugins:pretix_{}:status".format(ident),
+                kwargs={
+                    "order": payment.order.code,
+                    "payment": payment.pk,
+                    "hash": payment.order.tagged_secret("plugins:pretix_{}:status".format(ident)),
+                    "payment_provider": ident,
+                },
+            )
         return template.render(ctx)
 
     def checkout_prepare(self, request, total):
@@ -202,7 +329,17 @@ class OPPWAMethod(BasePaymentProvider):
     def is_allowed(self, request: HttpRequest, total: Decimal = None) -> bool:
         global_allowed = super().is_allowed(request, total)
 
-        return global_allowed and self.get_entity_id(request.event.testmode)
+        return (
+            global_allowed
+            and self.get_entity_id(request.event.testmode)
+            and not self.is_unavailable(request.event.testmode)
+        )
+
+    def is_unavailable(self, testmode):
+        """
+        Whether the method is hidden from customers because the circuit breaker of its endpoint is open.
+        """
+        return conf.getboolean("circuit_hide_methods") and circuit.is_open(self.get_endpoint_url(testmode))
 
     def order_change_allowed(self, order: Order, request: HttpRequest = None) -> bool:
         global_allowed = super().order_change_allowed(order, request)
@@ -210,21 +347,17 @@ class OPPWAMethod(BasePaymentProvider):
         return global_allowed and self.get_entity_id(request.event.testmode)
 
     def get_entity_id(self, testmode):
-        if (testmode and self.settings.endpoint == "test") or (
-            not testmode and self.settings.endpoint == "live"
-        ):
-            method = "scheme" if self.type == "meta" else self.method
-            return self.settings.get(
-                "entityId_{}".format(method), self.settings.get("entityId", False)
-            )
-        else:
-            return False
+        return self.config.get_entity_id("scheme" if self.type == "meta" else self.method, testmode)
 
     def get_setting(self, key, **kwargs):
         return self.settings.get(key, **kwargs)
 
     def execute_payment(self, request: HttpRequest, payment: OrderPayment):
         ident = self.identifier.split("_")[0]
+        if conf.getboolean("precreate_checkout"):
+            from .tasks import start_checkout_precreation
+
+            transaction.on_commit(lambda: start_checkout_precreation(self.event, payment))
         return eventreverse(
             self.event,
             "plugins:pretix_{}:pay".format(ident),
@@ -236,26 +369,35 @@ class OPPWAMethod(BasePaymentProvider):
             },
         )
 
-    def execute_refund(self, refund: OrderRefund):
-        payment_info = refund.payment.info_data
+    def _prepare_refund(self, refund: OrderRefund):
+        payment_info = codec.get_info(refund.payment)
         if not payment_info:
             raise PaymentException(_("No payment information found."))
 
-        s = self._init_api(refund.order.testmode)
+        testmode = refund.order.testmode
+        url = "{}/v1/payments/{}".format(self.get_endpoint_url(testmode), payment_info["id"])
         data = {
-            "entityId": self.get_entity_id(refund.order.testmode),
+            "entityId": self.get_entity_id(testmode),
             "amount": str(refund.amount),
             "currency": self.event.currency,
             "paymentType": "RF",
         }
+        return payment_info, testmode, url, data
+
+    def execute_refund(self, refund: OrderRefund):
+        from .refunds import defer, refunds_deferred
+
+        if refunds_deferred():
+            # Refunds of a cancelled event stay in the "created" state until they are sent along with all others
+            # by execute_refunds
+            defer(refund)
+            return
+
+        payment_info, testmode, url, data = self._prepare_refund(refund)
+        s = self._init_api(testmode)
 
         try:
-            r = s.post(
-                "{}/v1/payments/{}".format(
-                    self.get_endpoint_url(refund.order.testmode), payment_info["id"]
-                ),
-                data=data,
-            )
+            r = s.post(url, data=data)
         except requests.exceptions.RequestException as e:
             logger.exception("Error on creating refund: " + str(e))
             raise PaymentException(
@@ -265,8 +407,10 @@ class OPPWAMethod(BasePaymentProvider):
                 )
             )
         else:
-            refund.info = json.dumps(r.json())
+            codec.set_info(refund, codec.response_json(r))
             refund.save()
+            if "id" in codec.get_info(refund):
+                reference_transaction(refund, codec.get_info(refund)["id"])
 
         self.process_result(refund, payment_info, "execute_refund")
 
@@ -283,6 +427,18 @@ class OPPWAMethod(BasePaymentProvider):
             payment=payment.full_id,
         )
 
+    @classmethod
+    def parse_merchant_transaction_id(cls, merchant_transaction_id):
+        """
+        Returns the value of ``merchant_transaction_id_field`` of the payment ``get_merchant_transaction_id``
+        might have built ``merchant_transaction_id`` for, or ``None`` if the id does not follow the scheme.
+        """
+        prefix, sep, local_id = merchant_transaction_id.rpartition("-P-")
+        event_slug, sep_code, code = prefix.rpartition("-")
+        if not sep or not sep_code or not local_id.isdigit():
+            return None
+        return code
+
     def get_checkout_payload(self, payment: OrderPayment):
         ident = self.identifier.split("_")[0]
 
@@ -308,6 +464,105 @@ class OPPWAMethod(BasePaymentProvider):
             ),
         }
 
+    def _checkout_fingerprint(self, payment: OrderPayment):
+        return {
+            "amount": str(payment.amount),
+            "currency": self.event.currency,
+            "entityId": self.get_entity_id(payment.order.testmode),
+        }
+
+    def _checkout_widget_url(self, testmode, checkout_id):
+        return "{}/v1/paymentWidgets.js?checkoutId={}".format(
+            self.get_endpoint_url(testmode), checkout_id
+        )
+
+    def get_reusable_checkout_id(self, payment: OrderPayment):
+        """
+        Returns the id of the checkout previously created for this payment, as long as it was created for the
+        same amount, currency and entity and is still well within OPPWA's validity window.
+        """
+        info = codec.get_info(payment)
+        checkout = info.get("pretix_checkout")
+        if not checkout or "id" not in info:
+            return None
+        if info.get("result", {}).get("code") != CHECKOUT_CREATED_CODE:
+            return None
+        if time.time() - checkout.get("created", 0) > CHECKOUT_REUSE_SECONDS:
+            return None
+        if {k: checkout.get(k) for k in ("amount", "currency", "entityId")} != self._checkout_fingerprint(payment):
+            return None
+        return info["id"]
+
+    def get_checkout_url(self, payment: OrderPayment):
+        checkout_id = self.get_reusable_checkout_id(payment)
+        if checkout_id:
+            return self._checkout_widget_url(payment.order.testmode, checkout_id)
+        if conf.getboolean("precreate_checkout"):
+            # The checkout might still be in the making in the background, in which case we wait for it
+            url, created = single_flight(
+                self._checkout_flight_key(payment),
+                lambda: self._create_checkout_once(payment),
+                result_timeout=CHECKOUT_HANDOVER_SECONDS,
+                wait=conf.getfloat("precreate_wait", 5.0),
+                on_timeout=lambda: self._stored_checkout_url(payment, required=True),
+            )
+            return url
+        return self.create_checkout(payment)
+
+    def _stored_checkout_url(self, payment: OrderPayment, required=False):
+        """
+        Returns the URL of the checkout another request has stored for this payment in the meantime. If there is
+        none and ``required`` is set, the other request is still waiting for OPPWA, and we fail rather than
+        creating a second checkout.
+        """
+        payment.refresh_from_db(fields=["info"])
+        checkout_id = self.get_reusable_checkout_id(payment)
+        if checkout_id:
+            return self._checkout_widget_url(payment.order.testmode, checkout_id)
+        if required:
+            logger.warning(f"Timed out waiting for the checkout of payment {payment.full_id}")
+            raise PaymentException(
+                _(
+                    "We had trouble communicating with the payment service. Please try again and get "
+                    "in touch with us if this problem persists."
+                )
+            )
+
+    def _create_checkout_once(self, payment: OrderPayment):
+        # Another request might have stored a checkout since our copy of the payment has been loaded
+        return self._stored_checkout_url(payment) or self.create_checkout(payment)
+
+    def _checkout_flight_key(self, payment: OrderPayment):
+        return "pretix_oppwa:checkout:{}".format(payment.pk)
+
+    def _payment_status_cache_key(self, payment: OrderPayment):
+        ident = self.identifier.split("_")[0]
+        return payment_status_cache_key(payment.pk, payment.order.tagged_secret("plugins:pretix_{}:status".format(ident)))
+
+    def precreate_checkout(self, payment: OrderPayment):
+        """
+        Creates the checkout of a payment ahead of the customer arriving on the pay page, unless there already is
+        one. Called in the background after ``execute_payment`` if ``precreate_checkout`` is enabled.
+        """
+        if payment.state not in (OrderPayment.PAYMENT_STATE_CREATED, OrderPayment.PAYMENT_STATE_PENDING):
+            return
+        if self.get_reusable_checkout_id(payment):
+            return
+        single_flight(
+            self._checkout_flight_key(payment),
+            lambda: self._create_checkout_once(payment),
+            result_timeout=CHECKOUT_HANDOVER_SECONDS,
+            # The pay page is already creating it
+            on_timeout=lambda: None,
+        )
+
+    def _store_checkout(self, payment: OrderPayment, info):
+        info["pretix_checkout"] = dict(
+            self._checkout_fingerprint(payment), created=int(time.time())
+        )
+        codec.set_info(payment, info)
+        payment.save()
+
     def create_checkout(self, payment: OrderPayment):
         s = self._init_api(payment.order.testmode)
         data = self.get_checkout_payload(payment)
@@ -318,11 +573,11 @@ class OPPWAMethod(BasePaymentProvider):
                 data=data,
             )
             r.raise_for_status()
-            payment.info = json.dumps(r.json())
-            payment.save()
+            info = codec.response_json(r)
+            self._store_checkout(payment, info)
         except requests.exceptions.HTTPError as e:
             logger.exception("Error on creating payment: " + str(e))
-            payment.info = json.dumps(r.json())
+            codec.set_info(payment, codec.response_json(r))
             payment.save()
 
             raise PaymentException(
@@ -340,81 +595,192 @@ class OPPWAMethod(BasePaymentProvider):
                 )
             )
         else:
-            return "{}/v1/paymentWidgets.js?checkoutId={}".format(
-                self.get_endpoint_url(payment.order.testmode), r.json()["id"]
-            )
+            return self._checkout_widget_url(payment.order.testmode, info["id"])
+
+    def get_status_url(self, payment: OrderPayment, resource_path):
+        return "{}{}{}entityId={}".format(
+            self.get_endpoint_url(payment.order.testmode),
+            resource_path,
+            "&" if "?" in resource_path else "?",
+            self.get_entity_id(payment.order.testmode),
+        )
 
-    def get_brands(self):
-        if self.type == "meta":
-            module = importlib.import_module(
-                __name__.replace("oppwa", self.identifier.split("_")[0]).replace(
-                    ".payment", ".paymentmethods"
+    def get_reconciliation_resource_path(self, payment: OrderPayment):
+        """
+        Returns the resource path to query the current status of a payment from, without a resourcePath reported
+        by OPPWA. Once a transaction has been reported, ``payment.info`` contains the transaction itself, otherwise
+        only the checkout it was started from. Expired checkouts can no longer be queried, so their transactions
+        are looked up by their merchantTransactionId instead.
+        """
+        info = codec.get_info(payment)
+        if "id" not in info:
+            return None
+        if "paymentType" in info:
+            return "/v1/query/{}".format(info["id"])
+        if payment.created > now() - timedelta(seconds=CHECKOUT_VALIDITY_SECONDS):
+            return "/v1/checkouts/{}/payment".format(info["id"])
+        return "/v1/query?{}".format(urlencode({"merchantTransactionId": self.get_merchant_transaction_id(payment)}))
+
+    def get_reconciliation_transaction(self, resource_path, data):
+        """
+        Returns the transaction to process from the response to a status query for ``resource_path``, or ``None``
+        if no transaction has been found. Lookups by merchantTransactionId list all transactions of the payment,
+        of which the successful one, if any, or otherwise the latest counts. Refunds and reversals are ignored.
+        """
+        if not resource_path.startswith("/v1/query?"):
+            return data
+        transactions = [t for t in data.get("payments") or [] if t.get("paymentType") not in REFUND_PAYMENT_TYPES]
+        for transaction_data in transactions:
+            if results.classify(transaction_data["result"]["code"]) == results.SUCCESS:
+                return transaction_data
+        return transactions[-1] if transactions else None
+
+    def check_payment_status(self, payment: OrderPayment, data):
+        """
+        Makes sure that a transaction reported by OPPWA actually belongs to ``payment``.
+        """
+        expected_id = self.get_merchant_transaction_id(payment)
+        if data.get("merchantTransactionId") != expected_id:
+            logger.error(f"Merchant transaction mismatch on {expected_id}: {data!r}")
+            raise PaymentException(
+                _(
+                    "Sorry, we could not validate the payment result. Please try again or "
+                    "contact the event organizer to check if your payment was successful."
                 )
             )
-            methods = [
-                x["method"]
-                for x in list(
-                    filter(lambda d: d["type"] == "scheme", module.payment_methods)
-                )
-                if self.get_setting("method_{}".format(x["method"]), as_type=bool)
-            ]
 
-            if "GOOGLEPAY" in methods and not self.get_setting(
-                "method_GOOGLEPAY_merchantId"
-            ):
-                methods.remove("GOOGLEPAY")
-            return " ".join(methods)
+    def query_payment_status(self, payment: OrderPayment, resource_path):
+        """
+        Fetches the current status of the transaction behind ``resource_path`` from the payment provider and
+        makes sure it actually belongs to ``payment``. Transport errors are raised as ``RequestException``,
+        results that can not be attributed to the payment as ``PaymentException``.
+        """
+        s = self._init_api(payment.order.testmode)
+        r = s.get(self.get_status_url(payment, resource_path))
+        data = codec.response_json(r)
+        self.check_payment_status(payment, data)
+        return data
+
+    def _status_flight_key(self, payment: OrderPayment, resource_path):
+        return "pretix_oppwa:status:{}:{}".format(
+            payment.pk, hashlib.sha1(resource_path.encode()).hexdigest()
+        )
+
+    def handle_payment_status(self, payment: OrderPayment, resource_path, datasource):
+        """
+        Fetches and processes the status of the transaction behind ``resource_path``. The return and notify
+        views usually fire within milliseconds of each other, so concurrent calls for the same transaction
+        share a single upstream request and only the first one processes and logs the result. Calls arriving
+        after it has finished query the status again, as it might have changed in the meantime.
+
+        Returns ``True`` if this call processed the result itself.
+        """
+        if payment.state in FINAL_PAYMENT_STATES:
+            return False
+
+        def _fetch_and_process():
+            data = self.query_payment_status(payment, resource_path)
+            self.process_result(payment, data, datasource)
+            return data
+
+        data, processed = single_flight(
+            self._status_flight_key(payment, resource_path), _fetch_and_process, result_timeout=None
+        )
+        return processed
+
+    def handle_webhook_result(self, payment: OrderPayment, data, datasource="webhook"):
+        """
+        Processes a transaction pushed to the webhook. The notification has already been authenticated by
+        decrypting it, so unlike the return and notify views, we do not need to fetch the status from OPPWA.
+
+        Returns ``True`` if the result has been processed.
+        """
+        if payment.state in FINAL_PAYMENT_STATES:
+            return False
+        self.check_payment_status(payment, data)
+        self.process_result(payment, data, datasource)
+        return True
+
+    def get_brands(self):
+        if self.type == "meta":
+            return " ".join(self.config.brands)
         else:
             return self.method
 
-    @transaction.atomic
+    def _log_result_compact(self, payment: OrderPayment, data, datasource, state_changed):
+        """
+        Logs only the essentials of a result, and only if they differ from those of the last result logged for
+        the payment. The full payload is logged along only if the result changed the state of the payment, all
+        others are still available from the payment's info until they are superseded.
+        """
+        summary = {
+            "id": data.get("id"),
+            "code": data.get("result", {}).get("code"),
+            "brand": data.get("paymentBrand"),
+            "amount": data.get("amount"),
+            "currency": data.get("currency"),
+        }
+        fingerprint = hashlib.sha1(codec.dumps(summary).encode()).hexdigest()
+        key = "pretix_oppwa:log:{}".format(payment.pk)
+        if not state_changed and cache.get(key) == fingerprint:
+            return
+
+        logdata = dict(summary, source=datasource, payment=payment.local_id)
+        if state_changed:
+            logdata["data"] = data
+        payment.order.log_action("pretix_oppwa.oppwa.event", data=logdata)
+        transaction.on_commit(lambda: cache.set(key, fingerprint, 24 * 3600))
+
     def process_result(self, payment_or_refund, data, datasource):
+        """
+        Applies a result reported by the payment provider. Every outcome writes the payment or refund at most once,
+        and the row stays locked no longer than the single statement or pretix' own ``confirm()`` and ``fail()``
+        take, since the order's lock serializes everything else the customer does meanwhile.
+        """
         if isinstance(payment_or_refund, OrderPayment):
             payment = payment_or_refund
+            category = results.classify(data["result"]["code"])
+            metrics.result_processed(self.identifier.split("_")[0], "payment", category)
 
-            payment.order.log_action(
-                "pretix_oppwa.oppwa.event", data={"source": datasource, "data": data}
-            )
-
-            # Successfully processed transactions
-            if re.compile(r"^(000\.000\.|000\.100\.1|000\.[36])").match(
-                data["result"]["code"]
-            ):
-                if payment.state not in (
-                    OrderPayment.PAYMENT_STATE_CONFIRMED,
-                    OrderPayment.PAYMENT_STATE_REFUNDED,
-                ):
-                    payment.info_data = data
-                    payment.save(update_fields=["info"])
-                    payment.confirm()
-            # Successfully processed transactions that should be manually reviewed
-            elif re.compile(r"^(000\.400\.0[^3]|000\.400\.100)").match(
-                data["result"]["code"]
-            ):
-                if payment.state == OrderPayment.PAYMENT_STATE_CREATED:
-                    payment.state = OrderPayment.PAYMENT_STATE_PENDING
-                    payment.info_data = data
-                    payment.save(update_fields=["state", "info"])
-            # Pending transaction in background, might change in 30 minutes or time out
-            elif re.compile(r"^(000\.200)").match(data["result"]["code"]):
-                if payment.state == OrderPayment.PAYMENT_STATE_CREATED:
-                    payment.state = OrderPayment.PAYMENT_STATE_PENDING
-                    payment.info_data = data
-                    payment.save(update_fields=["state", "info"])
-            # Pending transaction in background, might change in some days or time out
-            elif re.compile(r"^(800\.400\.5|100\.400\.500)").match(
-                data["result"]["code"]
-            ):
-                if payment.state == OrderPayment.PAYMENT_STATE_CREATED:
-                    payment.state = OrderPayment.PAYMENT_STATE_PENDING
-                    payment.info_data = data
-                    payment.save(update_fields=["state", "info"])
-            else:
-                if payment.state not in (
-                    OrderPayment.PAYMENT_STATE_CONFIRMED,
-                    OrderPayment.PAYMENT_STATE_REFUNDED,
-                ):
-                    payment.fail(info=data)
+            compact_log = conf.getboolean("compact_log")
+            if not compact_log:
+                payment.order.log_action(
+                    "pretix_oppwa.oppwa.event", data={"source": datasource, "data": data}
+                )
+            state = payment.state
+            previous_id = codec.get_info(payment).get("id")
+
+            try:
+                if category == results.SUCCESS:
+                    if payment.state not in FINAL_PAYMENT_STATES:
+                        # confirm() stores the info along with the new state
+                        codec.set_info(payment, data)
+                        try:
+                            payment.confirm()
+                        except Quota.QuotaExceededException:
+                            # The payment is confirmed nonetheless, and the order stays unpaid for the organizer to
+                            # resolve, as with pretix' own payment providers
+                            pass
+                elif category in results.PENDING_CATEGORIES:
+                    if payment.state == OrderPayment.PAYMENT_STATE_CREATED:
+                        # Conditional, so that we never move a payment confirmed in the meantime back to pending
+                        codec.set_info(payment, data)
+                        if OrderPayment.objects.filter(
+                            pk=payment.pk, state=OrderPayment.PAYMENT_STATE_CREATED
+                        ).update(state=OrderPayment.PAYMENT_STATE_PENDING, info=payment.info):
+                            payment.state = OrderPayment.PAYMENT_STATE_PENDING
+                else:
+                    if payment.state not in FINAL_PAYMENT_STATES:
+                        payment.fail(info=data)
+            finally:
+                # confirm() might raise after it has already confirmed the payment, e.g. if the quota is exceeded
+                if payment.state != state and "paymentType" in data and data.get("id") not in (None, previous_id):
+                    reference_transaction(payment, data["id"])
+                if compact_log:
+                    self._log_result_compact(payment, data, datasource, state_changed=payment.state != state)
+                if payment.state != state:
+                    key = self._payment_status_cache_key(payment)
+                    transaction.on_commit(lambda: cache.delete(key))
 
         elif isinstance(payment_or_refund, OrderRefund) and payment_or_refund.state in (
             OrderRefund.REFUND_STATE_CREATED,
@@ -427,36 +793,24 @@ class OPPWAMethod(BasePaymentProvider):
                 refund.state = OrderRefund.REFUND_STATE_FAILED
                 refund.execution_date = now()
 
-            # Successfully processed transactions
-            if re.compile(r"^(000\.000\.|000\.100\.1|000\.[36])").match(
-                data["result"]["code"]
+            category = results.classify(data["result"]["code"])
+            metrics.result_processed(self.identifier.split("_")[0], "refund", category)
+            # execute_refund passes the info of the refunded payment, which must not be referenced for the refund
+            if data.get("paymentType") in REFUND_PAYMENT_TYPES and data.get("id") not in (
+                None, codec.get_info(refund).get("id")
             ):
-                refund.info_data = data
-                refund.save(update_fields=["info"])
-                refund.done()
-            # Successfully processed transactions that should be manually reviewed
-            elif re.compile(r"^(000\.400\.0[^3]|000\.400\.100)").match(
-                data["result"]["code"]
-            ):
-                refund.state = OrderRefund.REFUND_STATE_TRANSIT
-                refund.info_data = data
-                refund.save(update_fields=["state", "info"])
-            # Pending transaction in background, might change in 30 minutes or time out
-            elif re.compile(r"^(000\.200)").match(data["result"]["code"]):
+                reference_transaction(refund, data["id"])
+            codec.set_info(refund, data)
+            if category == results.SUCCESS:
+                # done() saves the whole refund, including its info, and possibly the payment along with it
+                with transaction.atomic():
+                    refund.done()
+            elif category in results.PENDING_CATEGORIES:
                 refund.state = OrderRefund.REFUND_STATE_TRANSIT
-                refund.info_data = data
-                refund.save(update_fields=["state", "info"])
-            # Pending transaction in background, might change in some days or time out
-            elif re.compile(r"^(800\.400\.5|100\.400\.500)").match(
-                data["result"]["code"]
-            ):
-                refund.state = OrderRefund.REFUND_STATE_TRANSIT
-                refund.info_data = data
                 refund.save(update_fields=["state", "info"])
             else:
                 refund.state = OrderRefund.REFUND_STATE_FAILED
                 refund.execution_date = now()
-                refund.info_data = data
                 refund.save(update_fields=["state", "execution_date", "info"])
         else:
             raise PaymentException(_("We had trouble processing your transaction."))
@@ -536,13 +890,12 @@ class OPPWAScheme(OPPWAMethod):
     @property
     def walletqueries(self):
         wallets = []
+        config = self.config
 
-        if self.get_setting("method_APPLEPAY", as_type=bool):
+        if "APPLEPAY" in config.methods:
             wallets.append(WalletQueries.APPLEPAY)
 
-        if self.get_setting("method_GOOGLEPAY", as_type=bool) and self.get_setting(
-            "method_GOOGLEPAY_merchantId"
-        ):
+        if "GOOGLEPAY" in config.methods and config.googlepay_merchant_id:
             wallets.append(WalletQueries.GOOGLEPAY)
 
         return wallets
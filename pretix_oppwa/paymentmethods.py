@@ -1,12 +1,64 @@
-from django import forms
+import threading
 from django.utils.translation import gettext_lazy as _
+from typing import NamedTuple, Optional
 
 from .payment import (
     OPPWAGooglePay, OPPWAMethod, OPPWApaydirekt, OPPWAPayPal, OPPWAScheme,
     OPPWASettingsHolder, OPPWANoRefundMethod,
 )
 
-payment_methods = [
+
+class PaymentMethod(NamedTuple):
+    identifier: str
+    type: str
+    method: str
+    public_name: str
+    verbose_name: str
+    baseclass: Optional[type] = None
+    help_text: str = ""
+    retired: bool = False
+
+
+class PaymentMethodRegistry:
+    """
+    Immutable collection of payment methods with precomputed indexes, built once at import time.
+    """
+    __slots__ = ("methods", "by_identifier", "by_method", "by_type", "schemes")
+
+    def __init__(self, methods):
+        self.methods = tuple(m if isinstance(m, PaymentMethod) else PaymentMethod(**m) for m in methods)
+        self.by_identifier = {m.identifier: m for m in self.methods}
+        self.by_method = {m.method: m for m in self.methods if m.method}
+        by_type = {}
+        for m in self.methods:
+            by_type.setdefault(m.type, []).append(m)
+        self.by_type = {k: tuple(v) for k, v in by_type.items()}
+        # Methods of type scheme, in the order they are offered in the payment widget
+        self.schemes = tuple(m.method for m in self.by_type.get("scheme", ()))
+
+    def __iter__(self):
+        return iter(self.methods)
+
+    def __len__(self):
+        return len(self.methods)
+
+    def provider_identifiers(self, brand):
+        """
+        Identifiers of all providers generated for the given brand from this registry.
+        """
+        return frozenset(
+            "{}_{}".format(brand.lower(), m.identifier) for m in self.methods if m.type != "scheme"
+        )
+
+    def subset(self, methods):
+        """
+        Returns a registry with only those methods whose uppercased identifier is contained in ``methods``.
+        """
+        methods = set(methods)
+        return PaymentMethodRegistry(m for m in self.methods if m.identifier.upper() in methods)
+
+
+payment_methods = PaymentMethodRegistry([
     {
         "identifier": "scheme",
         "type": "meta",
@@ -915,98 +967,69 @@ payment_methods = [
         "public_name": _("Trustpay VA"),
         "verbose_name": _("Trustpay VA"),
     },
-]
+])
 
 
 def get_payment_method_classes(
     brand, payment_methods, baseclass, settingsholder, unique_entity_id=True
 ):
-    settingsholder.payment_methods_settingsholder = []
-    for m in payment_methods:
-        if m.get("retired", False):
-            continue
-
-        # We do not want meta methods like "scheme" in the settings holder
-        if m["type"] == "meta":
-            continue
-        settingsholder.payment_methods_settingsholder.append(
-            (
-                "method_{}".format(m["method"]),
-                forms.BooleanField(
-                    label="{} {}".format(
-                        (
-                            '<span class="fa fa-credit-card"></span>'
-                            if m["type"] == "scheme"
-                            else ""
-                        ),
-                        m["verbose_name"],
-                    ),
-                    help_text=m["help_text"] if "help_text" in m else "",
-                    required=False,
-                ),
-            )
-        )
-        if "baseclass" in m:
-            for field in m["baseclass"].extra_form_fields:
-                settingsholder.payment_methods_settingsholder.append(
-                    ("method_{}_{}".format(m["method"], field[0]), field[1])
-                )
-
-        # All payment methods except the meta-Type "scheme" get their own EntityId Input
-        # If there is only a single, unique EntityId, we skip this, too.
-        if not settingsholder.unique_entity_id and m["type"] != "scheme":
-            settingsholder.payment_methods_settingsholder.append(
-                (
-                    "entityId_{}".format(m["method"]),
-                    forms.CharField(
-                        label="{} ({})".format(_("Entity ID"), m["verbose_name"]),
-                        required=False,
-                        widget=forms.TextInput(
-                            attrs={
-                                "data-display-dependency": "#id_payment_{brand}_method_{method}".format(
-                                    brand=brand.lower(),
-                                    method=m["method"],
-                                )
-                            }
-                        ),
-                    ),
-                ),
-            )
+    settingsholder.payment_methods = payment_methods
 
     # We do not want the "scheme"-methods listed as a payment-method, since they are covered by the meta methods
     return [settingsholder] + [
         type(
-            f'OPPWA{"".join(m["public_name"].split())}',
+            f'OPPWA{"".join(m.public_name.split())}',
             (
                 # Custom baseclasses should always inherit from the brand-specific baseclass
                 (
                     type(
-                        f'OPPWA{"".join(m["public_name"].split())}',
-                        (m["baseclass"], baseclass),
+                        f'OPPWA{"".join(m.public_name.split())}',
+                        (m.baseclass, baseclass),
                         {},
                     )
-                    if "baseclass" in m
+                    if m.baseclass
                     else baseclass
                 ),
             ),
             {
                 "identifier": "{payment_provider}_{payment_method}".format(
-                    payment_method=m["identifier"], payment_provider=brand.lower()
+                    payment_method=m.identifier, payment_provider=brand.lower()
                 ),
                 "verbose_name": _("{payment_method} via {payment_provider}").format(
-                    payment_method=m["verbose_name"], payment_provider=brand
+                    payment_method=m.verbose_name, payment_provider=brand
                 ),
-                "public_name": m["public_name"],
-                "method": m["method"],
-                "type": m["type"],
-                "retired": m.get("retired", False),
+                "public_name": m.public_name,
+                "method": m.method,
+                "type": m.type,
+                "retired": m.retired,
+                "payment_methods": payment_methods,
             },
         )
         for m in payment_methods
-        if m["type"] != "scheme"
+        if m.type != "scheme"
     ]
 
 
-payment_method_classes = get_payment_method_classes(
+class LazyPaymentMethodClasses:
+    """
+    Describes the provider classes of a brand without creating them. The ~100 classes per brand are only
+    generated once pretix first asks for the payment providers, instead of whenever a worker imports the plugin.
+    """
+
+    def __init__(self, brand, payment_methods, baseclass, settingsholder):
+        self.args = (brand, payment_methods, baseclass, settingsholder)
+        self.classes = None
+        self.lock = threading.Lock()
+        settingsholder.payment_methods = payment_methods
+
+    def __call__(self):
+        if self.classes is None:
+            with self.lock:
+                if self.classes is None:
+                    self.classes = get_payment_method_classes(*self.args)
+        return self.classes
+
+
+payment_method_classes = LazyPaymentMethodClasses(
     "OPPWA", payment_methods, OPPWAMethod, OPPWASettingsHolder
 )
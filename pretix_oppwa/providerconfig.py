@@ -0,0 +1,84 @@
+from pretix.base.models import Event
+from pretix.base.settings import SettingsSandbox
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Tuple
+
+
+class ProviderConfig(NamedTuple):
+    """
+    Immutable snapshot of the resolved payment settings of one brand (OPPWA, VR Payment or Hobex) for one event.
+    """
+    enabled: bool
+    endpoint: str
+    access_token: str
+    # Methods enabled in the settings, regardless of the global ``enabled`` switch
+    methods: frozenset
+    # Whether any scheme method is enabled, i.e. whether the credit card meta method is available
+    schemes_enabled: bool
+    # Enabled scheme methods in display order, as passed to the payment widget
+    brands: Tuple[str, ...]
+    # Method-specific entity ids, ``scheme`` being the one of the credit card meta method
+    entity_ids: Mapping[str, str]
+    default_entity_id: str
+    googlepay_merchant_id: str
+
+    def get_entity_id(self, method, testmode):
+        if self.endpoint != ("test" if testmode else "live"):
+            return False
+        return self.entity_ids.get(method, self.default_entity_id)
+
+
+def _build_config(event: Event, brand, payment_methods) -> ProviderConfig:
+    settings = SettingsSandbox("payment", brand, event)
+
+    methods = frozenset(
+        method for method in payment_methods.by_method
+        if settings.get("method_{}".format(method), as_type=bool)
+    )
+    entity_ids = {}
+    for key in ["scheme", *payment_methods.by_method]:
+        value = settings.get("entityId_{}".format(key))
+        if value is not None:
+            entity_ids[key] = value
+
+    googlepay_merchant_id = settings.get("method_GOOGLEPAY_merchantId")
+    schemes = [m for m in payment_methods.schemes if m in methods]
+    return ProviderConfig(
+        enabled=bool(settings.get("_enabled", as_type=bool)),
+        endpoint=settings.get("endpoint"),
+        access_token=settings.get("access_token"),
+        methods=methods,
+        schemes_enabled=bool(schemes),
+        brands=tuple(m for m in schemes if m != "GOOGLEPAY" or googlepay_merchant_id),
+        entity_ids=MappingProxyType(entity_ids),
+        default_entity_id=settings.get("entityId", False),
+        googlepay_merchant_id=googlepay_merchant_id,
+    )
+
+
+def get_provider_config(event: Event, brand, payment_methods) -> ProviderConfig:
+    """
+    Returns the settings snapshot of the given brand and its registry of payment methods for the event. pretix
+    evaluates all of the ~100 providers of a brand whenever it lists payment providers, so the snapshot is built
+    once and stored on the event instance, along with the settings it has been built from. It is rebuilt once
+    the event's settings have been reloaded, e.g. after ``flush()``, and dropped by
+    ``invalidate_provider_config`` whenever a payment setting is changed through the event instance.
+    """
+    settings = event.settings._cache()
+    try:
+        loaded, configs = event._oppwa_provider_config
+    except AttributeError:
+        loaded = configs = None
+    if loaded is not settings:
+        configs = {}
+        event._oppwa_provider_config = (settings, configs)
+
+    try:
+        return configs[brand]
+    except KeyError:
+        config = configs[brand] = _build_config(event, brand, payment_methods)
+        return config
+
+
+def invalidate_provider_config(event: Event):
+    event.__dict__.pop("_oppwa_provider_config", None)
@@ -0,0 +1,148 @@
+import logging
+import requests
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.timezone import now
+from pretix.base.models import OrderPayment
+from pretix.base.payment import PaymentException
+
+from pretix_oppwa import codec, results
+
+logger = logging.getLogger(__name__)
+
+BRANDS = ("oppwa", "vrpay", "hobex")
+# A run that has been stopped is continued by the next one only within this many seconds
+CURSOR_TIMEOUT = 24 * 3600
+
+
+class RateLimiter:
+    """
+    Spaces out calls across all threads so that no more than ``rate`` calls per second are started.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            slot = max(self.next_slot, time.monotonic())
+            self.next_slot = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def pending_payments(min_age=timedelta(minutes=45), max_age=timedelta(days=30)):
+    """
+    All OPPWA-family payments across all events that are still waiting for a result. Payments younger than
+    ``min_age`` are left alone, since their customers are probably still busy paying.
+    """
+    provider_filter = Q()
+    for brand in BRANDS:
+        provider_filter |= Q(provider__startswith="{}_".format(brand))
+
+    return OrderPayment.objects.filter(
+        provider_filter,
+        state__in=(OrderPayment.PAYMENT_STATE_CREATED, OrderPayment.PAYMENT_STATE_PENDING),
+        created__lte=now() - min_age,
+        created__gte=now() - max_age,
+    )
+
+
+def _fetch(session, url, limiter):
+    limiter.wait()
+    return codec.response_json(session.get(url))
+
+
+def reconcile_payments(queryset, concurrency=8, rate=None, chunk_size=500, limit=None, progress=None,
+                       cursor_key=None):
+    """
+    Queries the status of all payments in ``queryset`` from the payment provider and feeds the results through
+    ``process_result``. The payments are loaded in chunks of ``chunk_size``; the status requests of a chunk are
+    sent through a pool of ``concurrency`` threads, but no more than ``rate`` per second. All database work
+    happens on the calling thread.
+
+    If ``cursor_key`` is given, a run stopped by ``limit`` stores the last payment checked in the cache under
+    this key, and the next run continues after it instead of checking the same payments again.
+
+    ``progress`` is called with the statistics so far after every chunk. Returns the final statistics.
+    """
+    stats = Counter()
+    providers = {}
+    limiter = RateLimiter(rate)
+    start_pk = last_pk = cache.get(cursor_key, 0) if cursor_key else 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while limit is None or stats["checked"] < limit:
+            size = chunk_size if limit is None else min(chunk_size, limit - stats["checked"])
+            chunk = list(
+                queryset.filter(pk__gt=last_pk).select_related("order", "order__event").order_by("pk")[:size]
+            )
+            if not chunk:
+                last_pk = 0
+                if not start_pk:
+                    break
+                # Continue with the payments before the ones the previous run stopped at
+                queryset = queryset.filter(pk__lte=start_pk)
+                start_pk = 0
+                continue
+            last_pk = chunk[-1].pk
+
+            futures = []
+            for payment in chunk:
+                stats["checked"] += 1
+                event = payment.order.event
+                if event.pk not in providers:
+                    providers[event.pk] = event.get_payment_providers()
+                pprov = providers[event.pk].get(payment.provider)
+
+                path = pprov.get_reconciliation_resource_path(payment) if pprov else None
+                if not path:
+                    stats["skipped"] += 1
+                    continue
+                futures.append((
+                    payment,
+                    pprov,
+                    path,
+                    executor.submit(
+                        _fetch,
+                        pprov._init_api(payment.order.testmode),
+                        pprov.get_status_url(payment, path),
+                        limiter,
+                    ),
+                ))
+
+            for payment, pprov, path, future in futures:
+                try:
+                    data = pprov.get_reconciliation_transaction(path, future.result())
+                    if data is None:
+                        stats["unchanged"] += 1
+                        continue
+                    pprov.check_payment_status(payment, data)
+                    category = results.classify(data["result"]["code"])
+                    # A checkout that has not been used is reported as rejected, which we can not tell apart
+                    # from an actual rejection. Unpaid orders expire on their own, so we only apply progress.
+                    if category == results.REJECTED and payment.state == OrderPayment.PAYMENT_STATE_CREATED:
+                        stats["unchanged"] += 1
+                        continue
+                    pprov.process_result(payment, data, "reconciliation")
+                    stats[category] += 1
+                except (requests.exceptions.RequestException, PaymentException, KeyError) as e:
+                    logger.warning(f"Could not reconcile payment {payment.full_id}: {e}")
+                    stats["errors"] += 1
+
+            if progress:
+                progress(stats)
+
+    if cursor_key:
+        cache.set(cursor_key, last_pk, CURSOR_TIMEOUT)
+    return stats
@@ -0,0 +1,237 @@
+import contextvars
+import logging
+import requests
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from django.db.models import Case, F, Q, Value, When
+from pretix.base.models import OrderRefund
+from pretix.base.payment import PaymentException
+from urllib3.exceptions import NewConnectionError
+
+from pretix_oppwa import codec, conf, results
+from pretix_oppwa.circuit import CircuitOpen
+from pretix_oppwa.lookup import reference_transaction
+from pretix_oppwa.reconcile import BRANDS, RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Name of the celery task pretix cancels events in, the only flow whose refunds are deferred
+CANCEL_EVENT_TASK = "pretix.base.services.cancelevent.cancel_event"
+# Info of refunds that are waiting to be sent by execute_refunds, and of those that are being sent
+DEFERRED_INFO = {"bulk_refund": "deferred"}
+SENDING_INFO = {"bulk_refund": "sending"}
+# pretix lets admins confirm created refunds as done at any time, which must not keep them from being sent
+DEFERRED_STATES = (OrderRefund.REFUND_STATE_CREATED, OrderRefund.REFUND_STATE_DONE)
+
+_deferring = contextvars.ContextVar("pretix_oppwa_defer_refunds", default=False)
+
+
+@contextmanager
+def defer_refunds():
+    """
+    Within this block, ``execute_refund`` of OPPWA-family providers does not send refunds, but leaves them to
+    ``execute_refunds``, provided that ``bulk_refunds`` is enabled.
+    """
+    token = _deferring.set(True)
+    try:
+        yield
+    finally:
+        _deferring.reset(token)
+
+
+def refunds_deferred():
+    return _deferring.get() and conf.getboolean("bulk_refunds")
+
+
+def defer(refund):
+    codec.set_info(refund, DEFERRED_INFO)
+    refund.save(update_fields=["info"])
+
+
+def pending_refunds():
+    """
+    All OPPWA-family refunds across all events that have been deferred by ``execute_refund`` and not yet been
+    sent to the payment provider, including those an admin has confirmed as done in the meantime.
+    """
+    provider_filter = Q()
+    for brand in BRANDS:
+        provider_filter |= Q(provider__startswith="{}_".format(brand))
+
+    return OrderRefund.objects.filter(
+        provider_filter, state__in=DEFERRED_STATES, info__contains='"{}"'.format(DEFERRED_INFO["bulk_refund"])
+    )
+
+
+def _not_sent(e):
+    """
+    Whether the request has certainly not reached the payment provider, so that it is safe to send it again.
+    Read timeouts and dropped connections are ambiguous, the refund might have been executed nonetheless.
+    """
+    if isinstance(e, (requests.exceptions.ConnectTimeout, CircuitOpen)):
+        return True
+    if isinstance(e, requests.exceptions.ConnectionError) and e.args:
+        return isinstance(getattr(e.args[0], "reason", e.args[0]), NewConnectionError)
+    return False
+
+
+def _send(session, url, data, limiter, retries, backoff):
+    attempt = 0
+    while True:
+        limiter.wait()
+        try:
+            return codec.response_json(session.post(url, data=data))
+        except requests.exceptions.RequestException as e:
+            if attempt >= retries or not _not_sent(e):
+                raise
+            time.sleep(backoff * 2 ** attempt)
+            attempt += 1
+
+
+def _claim(refund):
+    # Replacing the marker and moving the refund to "in transit" before sending it makes sure that no other worker
+    # or later run sends it a second time, even if this process dies before the response has been stored. Refunds
+    # confirmed as done in the meantime keep their state.
+    info = codec.dumps(SENDING_INFO)
+    claimed = OrderRefund.objects.filter(
+        pk=refund.pk, state__in=DEFERRED_STATES, info=refund.info
+    ).update(
+        state=Case(
+            When(state=OrderRefund.REFUND_STATE_CREATED, then=Value(OrderRefund.REFUND_STATE_TRANSIT)),
+            default=F("state"),
+        ),
+        info=info,
+    )
+    if claimed:
+        refund.refresh_from_db(fields=["state", "info"])
+    return bool(claimed)
+
+
+def _release(refund):
+    OrderRefund.objects.filter(pk=refund.pk, info=refund.info).update(
+        state=Case(
+            When(state=OrderRefund.REFUND_STATE_TRANSIT, then=Value(OrderRefund.REFUND_STATE_CREATED)),
+            default=F("state"),
+        ),
+        info=codec.dumps(DEFERRED_INFO),
+    )
+    refund.refresh_from_db(fields=["state", "info"])
+
+
+def _record_confirmed(refund, response):
+    # The refund has been confirmed as done by an admin before it was sent, so its state is left alone
+    if "id" in response:
+        reference_transaction(refund, response["id"])
+    codec.set_info(refund, response)
+    refund.save(update_fields=["info"])
+    refund.order.log_action("pretix_oppwa.oppwa.event", data={"source": "bulk_refund", "data": response})
+    category = results.classify(response["result"]["code"])
+    if category not in (results.SUCCESS, *results.PENDING_CATEGORIES):
+        logger.error(f"Refund {refund.full_id} has been confirmed as done, but the payment provider rejected it")
+    return category
+
+
+def execute_refunds(queryset, concurrency=8, rate=None, retries=3, backoff=1.0, chunk_size=500, limit=None,
+                    progress=None):
+    """
+    Sends all refunds in ``queryset`` to the payment provider and feeds the responses through ``process_result``.
+    The requests are sent through a pool of ``concurrency`` threads, but no more than ``rate`` per second and
+    entity. Requests that could not be delivered are retried up to ``retries`` times with exponential backoff
+    starting at ``backoff`` seconds. All database work happens on the calling thread.
+
+    Every refund is claimed in the database before its request is sent, so concurrent runs never refund the
+    same payment twice. Refunds an admin has confirmed as done before they were sent are sent all the same, but
+    only their response is stored. Refunds that could not be delivered at all are released to be tried again later;
+    refunds whose requests might have reached the payment provider stay in transit and are reported as
+    ``unknown``, since they need to be checked manually.
+
+    ``progress`` is called with the statistics so far after every chunk. Returns the final statistics.
+    """
+    stats = Counter()
+    providers = {}
+    limiters = {}
+    last_pk = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while limit is None or stats["checked"] < limit:
+            size = chunk_size if limit is None else min(chunk_size, limit - stats["checked"])
+            chunk = list(
+                queryset.filter(pk__gt=last_pk).select_related(
+                    "order", "order__event", "payment"
+                ).order_by("pk")[:size]
+            )
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+
+            futures = []
+            for refund in chunk:
+                stats["checked"] += 1
+                event = refund.order.event
+                if event.pk not in providers:
+                    providers[event.pk] = event.get_payment_providers()
+                pprov = providers[event.pk].get(refund.provider)
+                if not pprov or not hasattr(pprov, "_prepare_refund"):
+                    stats["skipped"] += 1
+                    continue
+
+                try:
+                    _, testmode, url, data = pprov._prepare_refund(refund)
+                except (PaymentException, KeyError) as e:
+                    logger.warning(f"Could not prepare refund {refund.full_id}: {e}")
+                    stats["errors"] += 1
+                    continue
+
+                if not _claim(refund):
+                    stats["skipped"] += 1
+                    continue
+
+                if data["entityId"] not in limiters:
+                    limiters[data["entityId"]] = RateLimiter(rate)
+                futures.append((
+                    refund,
+                    pprov,
+                    executor.submit(
+                        _send,
+                        pprov._init_api(testmode),
+                        url,
+                        data,
+                        limiters[data["entityId"]],
+                        retries,
+                        backoff,
+                    ),
+                ))
+
+            for refund, pprov, future in futures:
+                try:
+                    response = future.result()
+                except requests.exceptions.RequestException as e:
+                    if _not_sent(e):
+                        logger.warning(f"Could not send refund {refund.full_id}: {e}")
+                        _release(refund)
+                        stats["errors"] += 1
+                    else:
+                        logger.error(f"Refund {refund.full_id} has been sent, but its result is unknown: {e}")
+                        refund.order.log_action(
+                            "pretix_oppwa.oppwa.event",
+                            data={"source": "bulk_refund", "data": {"error": str(e)}},
+                        )
+                        stats["unknown"] += 1
+                    continue
+
+                try:
+                    if refund.state == OrderRefund.REFUND_STATE_DONE:
+                        stats[_record_confirmed(refund, response)] += 1
+                        continue
+                    # process_result stores the response as the refund's info
+                    pprov.process_result(refund, response, "bulk_refund")
+                    stats[results.classify(response["result"]["code"])] += 1
+                except (PaymentException, KeyError) as e:
+                    logger.warning(f"Could not process refund {refund.full_id}: {e}")
+                    stats["errors"] += 1
+
+            if progress:
+                progress(stats)
+
+    return stats
@@ -0,0 +1,31 @@
+import re
+from functools import lru_cache
+
+# Categories of OPPWA result codes, see https://www.oppwa.com/integrations/reference/resultCodes
+SUCCESS = "success"  # Successfully processed transactions
+REVIEW = "review"  # Successfully processed transactions that should be manually reviewed
+PENDING = "pending"  # Pending transaction in background, might change in 30 minutes or time out
+PENDING_LONG = "pending_long"  # Pending transaction in background, might change in some days or time out
+REJECTED = "rejected"  # Everything else
+
+PENDING_CATEGORIES = frozenset((REVIEW, PENDING, PENDING_LONG))
+
+# A single alternation is matched once per code, the name of the matching group is the category.
+_result_code_regex = re.compile(
+    r"^(?:"
+    r"(?P<success>000\.000\.|000\.100\.1|000\.[36])"
+    r"|(?P<review>000\.400\.0[^3]|000\.400\.100)"
+    r"|(?P<pending>000\.200)"
+    r"|(?P<pending_long>800\.400\.5|100\.400\.500)"
+    r")"
+)
+
+
+@lru_cache(maxsize=512)
+def classify(code: str) -> str:
+    """
+    Maps an OPPWA result code to one of the categories defined in this module. Since there is only a
+    limited number of distinct result codes, the result is cached per code.
+    """
+    m = _result_code_regex.match(code)
+    return m.lastgroup if m else REJECTED
@@ -0,0 +1,323 @@
+import csv
+import json
+import logging
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from pretix.base.models import OrderPayment, OrderRefund
+from pretix.base.payment import PaymentException
+
+from pretix_oppwa import codec
+from pretix_oppwa.lookup import resolve_payments, resolve_transactions
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_TYPES = ("DB", "CP")
+REFUND_TYPES = ("RF", "RV")
+CHARGEBACK_TYPES = ("CB", "CR")
+
+# Column names of the different report formats, lowercased and without separators
+COLUMNS = {
+    "id": ("id", "uniqueid", "transactionuniqueid"),
+    "merchantTransactionId": ("merchanttransactionid", "transactionid"),
+    "referencedId": ("referencedid", "referenceid", "referenceuniqueid"),
+    "paymentType": ("paymenttype",),
+    "amount": ("amount", "transactionamount"),
+    "currency": ("currency", "transactioncurrency"),
+    "code": ("resultcode", "returncode", "code"),
+}
+_column_aliases = {alias: name for name, aliases in COLUMNS.items() for alias in aliases}
+
+REPORT_FIELDS = ["row", "paymentType", "id", "merchantTransactionId", "amount", "currency", "status", "detail"]
+
+
+def _normalize(record):
+    row = {}
+    for key, value in record.items():
+        if key is None:
+            continue
+        if key == "result" and isinstance(value, dict):
+            key, value = "code", value.get("code")
+        name = _column_aliases.get(key.lower().replace("_", "").replace(" ", "").replace(".", ""))
+        if name and value not in (None, ""):
+            row[name] = str(value).strip()
+    return row
+
+
+def iter_csv_records(f):
+    """
+    Yields the rows of a CSV report. The delimiter is guessed from the header line.
+    """
+    header = f.readline()
+    dialect = csv.Sniffer().sniff(header, delimiters=",;\t|")
+    fieldnames = next(csv.reader([header], dialect))
+    yield from csv.DictReader(f, fieldnames=fieldnames, dialect=dialect)
+
+
+class _JSONStream:
+    """
+    Decodes a JSON document piece by piece from a file, keeping only the current value in memory.
+    """
+
+    def __init__(self, f, read_size=1 << 16):
+        self.f = f
+        self.read_size = read_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self.f.read(self.read_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, c):
+        if self.peek() != c:
+            raise ValueError("Expected {!r} at offset {}".format(c, self.pos))
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number might continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def array_items(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == "]":
+                self.pos += 1
+                return
+            self.expect(",")
+
+    def first_array_items(self):
+        """
+        Yields the items of the document if it is an array, or of its first member that is an array otherwise.
+        """
+        if self.peek() == "[":
+            yield from self.array_items()
+            return
+        self.expect("{")
+        while self.peek() not in ("}", ""):
+            self.value()
+            self.expect(":")
+            if self.peek() == "[":
+                yield from self.array_items()
+                return
+            self.value()
+            if self.peek() == ",":
+                self.pos += 1
+
+
+def iter_json_records(f):
+    """
+    Yields the transactions of a JSON report, which is either a document listing them in an array or a file
+    with one transaction per line (JSON Lines).
+    """
+    # A document might well be a single line, so we only look at the beginning of it
+    first = f.readline(1 << 16)
+    try:
+        record = codec.loads(first)
+    except ValueError:
+        record = None
+    if isinstance(record, dict) and not any(isinstance(v, list) for v in record.values()):
+        yield record
+        for line in f:
+            if line.strip():
+                yield codec.loads(line)
+        return
+
+    f.seek(0)
+    yield from _JSONStream(f).first_array_items()
+
+
+def _parse_amount(value):
+    try:
+        return Decimal(value)
+    except (InvalidOperation, TypeError):
+        return None
+
+
+class SettlementImporter:
+    """
+    Matches the transactions of a settlement report of ``brand`` to payments and refunds and reports every
+    transaction that does not agree with them. Payments are matched through their merchantTransactionId or, failing
+    that, their transaction id, refunds through their transaction id. Payments and refunds that are still waiting
+    for a result are updated through ``process_result``, unless ``dry_run`` is set. Rows without a result code
+    are reported as invalid instead.
+
+    Rows are handled in batches of ``chunk_size``, and only the payments and refunds of the current batch are
+    loaded, so memory usage does not depend on the size of the report or the number of transactions in pretix.
+    """
+
+    def __init__(self, brand, report=None, chunk_size=500, dry_run=False):
+        self.brand = brand
+        self.report = report
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.stats = Counter()
+        self.providers = {}
+
+    def run(self, records, progress=None):
+        batch = []
+        for i, record in enumerate(records, start=1):
+            batch.append((i, _normalize(record)))
+            if len(batch) >= self.chunk_size:
+                self._process_batch(batch)
+                batch = []
+                if progress:
+                    progress(self.stats)
+        if batch:
+            self._process_batch(batch)
+            if progress:
+                progress(self.stats)
+        return self.stats
+
+    def _report(self, lineno, row, status, detail=""):
+        self.stats[status] += 1
+        if self.report is not None:
+            self.report.writerow(dict(
+                {k: row.get(k, "") for k in REPORT_FIELDS}, row=lineno, status=status, detail=detail
+            ))
+
+    def _get_provider(self, obj):
+        event = obj.order.event
+        if event.pk not in self.providers:
+            self.providers[event.pk] = event.get_payment_providers()
+        return self.providers[event.pk].get(obj.provider)
+
+    def _process_batch(self, batch):
+        payments = resolve_payments(
+            self.brand,
+            [row["merchantTransactionId"] for lineno, row in batch
+             if row.get("paymentType") in PAYMENT_TYPES and "merchantTransactionId" in row],
+        )
+        # Payments whose merchantTransactionId is missing or unknown are looked up by their transaction id
+        payments_by_id = resolve_transactions(
+            self.brand,
+            [row["id"] for lineno, row in batch
+             if row.get("paymentType") in PAYMENT_TYPES and "id" in row
+             and row.get("merchantTransactionId") not in payments],
+        )
+        refunds = resolve_transactions(
+            self.brand,
+            [row["id"] for lineno, row in batch if row.get("paymentType") in REFUND_TYPES and "id" in row],
+            refunds=True,
+        )
+
+        for lineno, row in batch:
+            self.stats["rows"] += 1
+            payment_type = row.get("paymentType")
+            if "id" not in row or not payment_type:
+                self._report(lineno, row, "invalid", "Transaction id or payment type missing")
+            elif payment_type in PAYMENT_TYPES:
+                self._process_payment(
+                    lineno, row, payments.get(row.get("merchantTransactionId")) or payments_by_id.get(row["id"])
+                )
+            elif payment_type in REFUND_TYPES:
+                self._process_refund(lineno, row, refunds.get(row["id"]))
+            elif payment_type in CHARGEBACK_TYPES:
+                self._report(lineno, row, "chargeback", "Chargebacks need to be handled manually")
+            else:
+                self.stats["ignored"] += 1
+
+    def _result(self, obj, row):
+        data = dict(codec.get_info(obj))
+        data.update({k: v for k, v in row.items() if k != "code"})
+        data["result"] = {"code": row["code"], "description": "Settlement report"}
+        return data
+
+    def _check_amount(self, lineno, row, obj):
+        amount = _parse_amount(row.get("amount"))
+        if amount is not None and amount != obj.amount:
+            self._report(lineno, row, "amount_mismatch", "Expected {} {}".format(obj.amount, obj.order.event.currency))
+            return False
+        if row.get("currency") and row["currency"] != obj.order.event.currency:
+            self._report(lineno, row, "amount_mismatch", "Expected {} {}".format(obj.amount, obj.order.event.currency))
+            return False
+        return True
+
+    def _process_payment(self, lineno, row, payment):
+        if payment is None:
+            self._report(lineno, row, "unmatched", "No payment with this merchantTransactionId or transaction id")
+            return
+        if not self._check_amount(lineno, row, payment):
+            return
+
+        info_id = codec.get_info(payment).get("id")
+        if payment.state in (OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED):
+            if info_id and info_id != row["id"] and "paymentType" in codec.get_info(payment):
+                self._report(lineno, row, "id_mismatch", "Payment {} has been confirmed with transaction {}".format(
+                    payment.full_id, info_id
+                ))
+            else:
+                self.stats["matched"] += 1
+        elif payment.state in (OrderPayment.PAYMENT_STATE_CREATED, OrderPayment.PAYMENT_STATE_PENDING):
+            self._update(lineno, row, payment)
+        else:
+            self._report(lineno, row, "state_mismatch", "Payment {} is {}".format(payment.full_id, payment.state))
+
+    def _process_refund(self, lineno, row, refund):
+        if refund is None:
+            self._report(lineno, row, "unmatched", "No refund with this transaction id")
+            return
+        if not self._check_amount(lineno, row, refund):
+            return
+
+        if refund.state == OrderRefund.REFUND_STATE_DONE:
+            self.stats["matched"] += 1
+        elif refund.state in (OrderRefund.REFUND_STATE_CREATED, OrderRefund.REFUND_STATE_TRANSIT):
+            self._update(lineno, row, refund)
+        else:
+            self._report(lineno, row, "state_mismatch", "Refund {} is {}".format(refund.full_id, refund.state))
+
+    def _update(self, lineno, row, obj):
+        state = obj.state
+        if "code" not in row:
+            # The state of the transaction is unknown without its result code
+            self._report(lineno, row, "invalid", "Result code missing, {} {} has not been processed".format(
+                obj.full_id, state
+            ))
+            return
+        if self.dry_run:
+            self._report(lineno, row, "updated", "{} {} would be processed".format(obj.full_id, state))
+            return
+
+        pprov = self._get_provider(obj)
+        if pprov is None:
+            self._report(lineno, row, "error", "Payment provider {} is not available".format(obj.provider))
+            return
+        try:
+            pprov.process_result(obj, self._result(obj, row), "settlement")
+        except (PaymentException, KeyError) as e:
+            logger.warning(f"Could not process settled transaction {row['id']}: {e}")
+            self._report(lineno, row, "error", str(e))
+            return
+        self._report(lineno, row, "updated", "{} {} -> {}".format(obj.full_id, state, obj.state))
@@ -1,11 +1,22 @@
+from celery.signals import task_postrun, task_prerun
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.http import HttpRequest, HttpResponse
 from django.urls import resolve
 from django.utils.translation import gettext_lazy as _  # NoQA
+from django_scopes import scopes_disabled
+from functools import lru_cache
 from pretix.base.middleware import _merge_csp, _parse_csp, _render_csp
-from pretix.base.signals import logentry_display, register_payment_providers
+from pretix.base.models import Event_SettingsStore
+from pretix.base.settings import SettingsSandbox
+from pretix.base.signals import (
+    logentry_display, periodic_task, register_data_exporters,
+    register_multievent_data_exporters, register_payment_providers,
+)
+from pretix.helpers.periodic import minimum_interval
 from pretix.presale.signals import process_response
 
+from pretix_oppwa import conf, providerconfig
 from pretix_oppwa.payment import OPPWASettingsHolder
 
 
@@ -13,7 +24,7 @@ from pretix_oppwa.payment import OPPWASettingsHolder
 def register_payment_provider(sender, **kwargs):
     from .paymentmethods import payment_method_classes
 
-    return payment_method_classes
+    return payment_method_classes()
 
 
 @receiver(signal=process_response, dispatch_uid="payment_oppwa_middleware_resp")
@@ -28,41 +39,131 @@ def signal_process_response(
 def wrapped_signal_process_response(
     settingsholder, sender, request: HttpRequest, response: HttpResponse, **kwargs
 ):
-    provider = settingsholder(sender)
-    url = resolve(request.path_info)
-
-    if provider.settings.get("_enabled", as_type=bool) and "pay" in url.url_name:
-        if "Content-Security-Policy" in response:
-            h = _parse_csp(response["Content-Security-Policy"])
-        else:
-            h = {}
-
-        csps = {
-            "script-src": provider.baseURLs
-            + [
-                "https://oppwa.com/",
-                "https://test.oppwa.com/",
-                "https://pay.google.com/",
-                "'unsafe-eval'",
-            ],
-            "style-src": provider.baseURLs + ["https://oppwa.com/", "'unsafe-inline'"],
-            "connect-src": provider.baseURLs + ["https://oppwa.com/"],
-            "img-src": provider.baseURLs
-            + ["https://oppwa.com/", "https://www.gstatic.com/"],
-            "frame-src": provider.baseURLs
-            + ["https://oppwa.com/", "https://pay.google.com/", "https:"],
-        }
-
-        _merge_csp(h, csps)
-
-        if h:
-            response["Content-Security-Policy"] = _render_csp(h)
+    # This runs for every presale response, so we bail out as cheaply as possible for everything but payment
+    # pages, of this plugin as well as of pretix itself.
+    ident = settingsholder.identifier.split("_")[0]
+    url = getattr(request, "resolver_match", None) or resolve(request.path_info)
+    if "pay" not in (url.url_name or ""):
+        return response
+
+    if SettingsSandbox("payment", ident, sender).get("_enabled", as_type=bool):
+        response["Content-Security-Policy"] = _merged_csp(
+            settingsholder, response.get("Content-Security-Policy")
+        )
     return response
 
 
+@lru_cache(maxsize=None)
+def _csp_fragment(settingsholder):
+    base_urls = settingsholder.baseURLs
+    if conf.get("test_endpoint_url"):
+        base_urls = base_urls + [conf.get("test_endpoint_url")]
+    return {
+        "script-src": base_urls
+        + [
+            "https://oppwa.com/",
+            "https://test.oppwa.com/",
+            "https://pay.google.com/",
+            "'unsafe-eval'",
+        ],
+        "style-src": base_urls + ["https://oppwa.com/", "'unsafe-inline'"],
+        "connect-src": base_urls + ["https://oppwa.com/"],
+        "img-src": base_urls
+        + ["https://oppwa.com/", "https://www.gstatic.com/"],
+        "frame-src": base_urls
+        + ["https://oppwa.com/", "https://pay.google.com/", "https:"],
+    }
+
+
+@lru_cache(maxsize=256)
+def _merged_csp(settingsholder, header):
+    h = _parse_csp(header) if header else {}
+    # _merge_csp adopts and modifies our lists, so it must only ever see copies of them
+    _merge_csp(h, {k: list(v) for k, v in _csp_fragment(settingsholder).items()})
+    return _render_csp(h)
+
+
+@receiver(signal=post_save, sender=Event_SettingsStore, dispatch_uid="payment_oppwa_settings_saved")
+@receiver(signal=post_delete, sender=Event_SettingsStore, dispatch_uid="payment_oppwa_settings_deleted")
+def invalidate_provider_config(sender, instance, **kwargs):
+    # hierarkey writes settings through the event instance they belong to, which holds the provider config
+    if instance.key.startswith("payment_") and Event_SettingsStore.object.is_cached(instance):
+        providerconfig.invalidate_provider_config(instance.object)
+
+
 @receiver(signal=logentry_display, dispatch_uid="payment_oppwa_logentry_display")
 def logentry_display(sender, logentry, **kwargs):
     if logentry.action_type != "pretix_oppwa.oppwa.event":
         return
 
     return _("OPPWA reported an event")
+
+
+@receiver(signal=periodic_task, dispatch_uid="payment_oppwa_reconcile")
+@scopes_disabled()
+@minimum_interval(minutes_after_success=conf.getint("reconcile_interval", 30))
+def reconcile_pending_payments(sender, **kwargs):
+    from .reconcile import pending_payments, reconcile_payments
+
+    if not conf.getboolean("reconcile_periodic"):
+        return
+
+    reconcile_payments(
+        pending_payments(),
+        concurrency=conf.getint("reconcile_concurrency", 4),
+        rate=conf.getfloat("reconcile_rate", None),
+        limit=conf.getint("reconcile_limit", 2000),
+        cursor_key="pretix_oppwa:reconcile:cursor",
+    )
+
+
+@receiver(signal=periodic_task, dispatch_uid="payment_oppwa_bulk_refunds")
+@scopes_disabled()
+@minimum_interval(minutes_after_success=conf.getint("bulk_refund_interval", 5))
+def execute_pending_refunds(sender, **kwargs):
+    from .refunds import execute_refunds, pending_refunds
+
+    if not conf.getboolean("bulk_refunds"):
+        return
+
+    execute_refunds(
+        pending_refunds(),
+        concurrency=conf.getint("bulk_refund_concurrency", 8),
+        rate=conf.getfloat("bulk_refund_rate", None),
+        limit=conf.getint("bulk_refund_limit", None),
+    )
+
+
+# Refund deferral of the event cancellations running in this process, by celery task id
+_deferrals = {}
+
+
+@receiver(signal=task_prerun, dispatch_uid="payment_oppwa_defer_cancellation_refunds")
+def defer_cancellation_refunds(sender=None, task_id=None, task=None, **kwargs):
+    from .refunds import CANCEL_EVENT_TASK, defer_refunds
+
+    if task is not None and task.name == CANCEL_EVENT_TASK:
+        deferral = defer_refunds()
+        deferral.__enter__()
+        _deferrals[task_id] = deferral
+
+
+@receiver(signal=task_postrun, dispatch_uid="payment_oppwa_end_cancellation_refunds")
+def end_cancellation_refunds(sender=None, task_id=None, **kwargs):
+    deferral = _deferrals.pop(task_id, None)
+    if deferral is not None:
+        deferral.__exit__(None, None, None)
+
+
+@receiver(register_data_exporters, dispatch_uid="payment_oppwa_export_transactions")
+def register_transaction_exporter(sender, **kwargs):
+    from .exporters import TransactionExporter
+
+    return TransactionExporter
+
+
+@receiver(register_multievent_data_exporters, dispatch_uid="payment_oppwa_multiexport_transactions")
+def register_multievent_transaction_exporter(sender, **kwargs):
+    from .exporters import TransactionExporter
+
+    return TransactionExporter
@@ -0,0 +1,54 @@
+import time
+from django.core.cache import cache
+
+# Seconds the result is kept for callers waiting for it if it is not to be reused by later callers
+HANDOVER_SECONDS = 2
+
+
+def single_flight(key, fn, lock_timeout=60, result_timeout=120, wait=15, interval=0.1, on_timeout=None):
+    """
+    Makes sure that ``fn`` is only executed once at a time across all workers for the given ``key``. Callers
+    arriving while another caller is already executing ``fn`` wait for and reuse its result, as do callers
+    arriving up to ``result_timeout`` seconds later. If ``result_timeout`` is ``None``, the result is only
+    shared with the callers that have been waiting for it, and every later caller executes ``fn`` again.
+
+    Returns a tuple of the result and a boolean that is ``True`` if ``fn`` has been executed by this caller.
+    If the executing caller fails, the waiting caller executes ``fn`` itself. So it does if the executing
+    caller takes longer than ``wait`` seconds, unless ``on_timeout`` is given, whose result is returned
+    instead. ``fn`` must not return ``None``.
+    """
+    lock_key = "{}:lock".format(key)
+    result_key = "{}:result".format(key)
+
+    if result_timeout is not None:
+        result = cache.get(result_key)
+        if result is not None:
+            return result, False
+
+    if not cache.add(lock_key, True, lock_timeout):
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(interval)
+            result = cache.get(result_key)
+            if result is not None:
+                return result, False
+            if not cache.get(lock_key):
+                # The executing caller might have stored its result and released the lock since we last looked
+                result = cache.get(result_key)
+                if result is not None:
+                    return result, False
+                break
+        else:
+            if on_timeout is not None:
+                return on_timeout(), False
+        return fn(), True
+
+    try:
+        if result_timeout is None:
+            # Do not hand the result of an earlier call to the callers waiting for this one
+            cache.delete(result_key)
+        result = fn()
+        cache.set(result_key, result, HANDOVER_SECONDS if result_timeout is None else result_timeout)
+        return result, True
+    finally:
+        cache.delete(lock_key)
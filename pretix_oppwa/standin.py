@@ -0,0 +1,214 @@
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+logger = logging.getLogger(__name__)
+
+CHECKOUT_CREATED_CODE = "000.200.100"
+# Used for all unknown checkouts and payments as well as all unsupported requests
+INVALID_REQUEST_CODE = "200.300.404"
+SERVER_ERROR_CODE = "900.100.300"
+# Reported for lookups by merchantTransactionId that do not match any transaction
+NOT_FOUND_CODE = "700.400.580"
+QUERY_SUCCESS_CODE = "000.000.100"
+
+WIDGET_SCRIPT = b"""// Payment widget of the local OPPWA stand-in
+(function () {
+    var checkoutId = new URL(document.currentScript.src).searchParams.get("checkoutId");
+    document.addEventListener("DOMContentLoaded", function () {
+        var form = document.querySelector("form.paymentWidgets");
+        if (!form) {
+            return;
+        }
+        var button = document.createElement("button");
+        button.type = "submit";
+        button.className = "btn btn-primary btn-lg";
+        button.textContent = "Pay (stand-in)";
+        form.appendChild(button);
+        form.addEventListener("submit", function (e) {
+            e.preventDefault();
+            var url = new URL(form.action);
+            url.searchParams.set("resourcePath", "/v1/checkouts/" + checkoutId + "/payment");
+            window.location = url.toString();
+        });
+    });
+})();
+"""
+
+
+class StandInGateway:
+    """
+    In-memory stand-in for the parts of the OPPWA API used by this plugin, to be used for development and load
+    tests instead of the payment provider's test system. Every response is delayed by ``latency`` seconds plus a
+    random ``jitter``; ``error_rate`` and ``drop_rate`` are the shares of requests that are answered with a server
+    error or not answered at all. Payments and refunds are given a random result code out of ``result_codes`` and
+    ``refund_result_codes``.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, drop_rate=0.0, result_codes=("000.100.110",),
+                 refund_result_codes=("000.100.110",)):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.result_codes = tuple(result_codes)
+        self.refund_result_codes = tuple(refund_result_codes)
+        self.checkouts = {}
+        self.payments = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _new_id():
+        return "8ac7a4{}".format(uuid.uuid4().hex[:26])
+
+    @staticmethod
+    def _envelope(code, **data):
+        return dict(
+            data,
+            result={"code": code, "description": "Result of the local OPPWA stand-in"},
+            buildNumber="standin",
+            timestamp=datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f%z"),
+            ndc=uuid.uuid4().hex,
+        )
+
+    def _transaction(self, transaction_id, checkout, code):
+        return self._envelope(
+            code,
+            id=transaction_id,
+            paymentType=checkout.get("paymentType", "DB"),
+            paymentBrand=checkout.get("paymentBrand", "VISA"),
+            amount=checkout.get("amount"),
+            currency=checkout.get("currency"),
+            descriptor=checkout.get("descriptor"),
+            merchantTransactionId=checkout.get("merchantTransactionId"),
+        )
+
+    def create_checkout(self, data):
+        if "entityId" not in data or "amount" not in data:
+            return 400, self._envelope(INVALID_REQUEST_CODE)
+        checkout_id = self._new_id()
+        with self.lock:
+            self.checkouts[checkout_id] = dict(data)
+        return 200, self._envelope(CHECKOUT_CREATED_CODE, id=checkout_id)
+
+    def checkout_payment(self, checkout_id):
+        with self.lock:
+            checkout = self.checkouts.get(checkout_id)
+            if checkout is None:
+                return 400, self._envelope(INVALID_REQUEST_CODE)
+            # The outcome of a checkout is fixed once it has been queried for the first time
+            if "payment" not in checkout:
+                payment_id = self._new_id()
+                checkout["payment"] = payment_id
+                self.payments[payment_id] = self._transaction(payment_id, checkout, random.choice(self.result_codes))
+            return 200, self.payments[checkout["payment"]]
+
+    def query(self, payment_id):
+        with self.lock:
+            payment = self.payments.get(payment_id)
+        if payment is None:
+            return 400, self._envelope(INVALID_REQUEST_CODE)
+        return 200, payment
+
+    def query_by_merchant_transaction_id(self, merchant_transaction_id):
+        with self.lock:
+            payments = [
+                p for p in self.payments.values() if p.get("merchantTransactionId") == merchant_transaction_id
+            ]
+        if not payments:
+            return 200, self._envelope(NOT_FOUND_CODE)
+        return 200, self._envelope(QUERY_SUCCESS_CODE, payments=payments)
+
+    def back_office(self, payment_id, data):
+        with self.lock:
+            payment = self.payments.get(payment_id)
+        if payment is None or data.get("paymentType") != "RF":
+            return 400, self._envelope(INVALID_REQUEST_CODE)
+        refund_id = self._new_id()
+        refund = self._transaction(
+            refund_id, dict(payment, **data), random.choice(self.refund_result_codes)
+        )
+        refund["referencedId"] = payment_id
+        with self.lock:
+            self.payments[refund_id] = refund
+        return 200, refund
+
+    def handle(self, method, path, data):
+        parts = path.strip("/").split("/")
+        if method == "POST" and parts == ["v1", "checkouts"]:
+            return self.create_checkout(data)
+        if method == "GET" and len(parts) == 4 and parts[:2] == ["v1", "checkouts"] and parts[3] == "payment":
+            return self.checkout_payment(parts[2])
+        if method == "GET" and parts == ["v1", "query"] and "merchantTransactionId" in data:
+            return self.query_by_merchant_transaction_id(data["merchantTransactionId"])
+        if method == "GET" and len(parts) == 3 and parts[:2] == ["v1", "query"]:
+            return self.query(parts[2])
+        if method == "POST" and len(parts) == 3 and parts[:2] == ["v1", "payments"]:
+            return self.back_office(parts[2], data)
+        return 404, self._envelope(INVALID_REQUEST_CODE)
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    server_version = "OPPWAStandIn/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def gateway(self) -> StandInGateway:
+        return self.server.gateway
+
+    def _respond(self, method):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        data = dict(parse_qsl(self.rfile.read(length).decode())) if length else dict(parse_qsl(url.query))
+
+        gateway = self.gateway
+        delay = gateway.latency + random.uniform(0, gateway.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        if random.random() < gateway.drop_rate:
+            self.close_connection = True
+            return
+
+        if method == "GET" and url.path == "/v1/paymentWidgets.js":
+            self._send(200, WIDGET_SCRIPT, "application/javascript")
+            return
+
+        if random.random() < gateway.error_rate:
+            status, body = 500, gateway._envelope(SERVER_ERROR_CODE)
+        else:
+            status, body = gateway.handle(method, url.path, data)
+        self._send(status, json.dumps(body).encode(), "application/json;charset=UTF-8")
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting, e.g. because of a simulated latency beyond its read timeout
+            self.close_connection = True
+
+    def do_GET(self):
+        self._respond("GET")
+
+    def do_POST(self):
+        self._respond("POST")
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def make_server(host, port, gateway: StandInGateway):
+    server = ThreadingHTTPServer((host, port), StandInRequestHandler)
+    server.daemon_threads = True
+    server.gateway = gateway
+    return server
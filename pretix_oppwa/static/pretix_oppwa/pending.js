@@ -0,0 +1,34 @@
+$(function () {
+    // Instead of having customers reload the whole order page, ask for the state of a pending payment every now and
+    // then, less often the longer it takes, and only reload once it has changed.
+    var $status = $("[data-oppwa-status-url]");
+    if (!$status.length) {
+        return;
+    }
+    var url = $status.attr("data-oppwa-status-url");
+    var delay = 3000;
+    var deadline = Date.now() + 30 * 60 * 1000;
+
+    function schedule() {
+        delay = Math.min(delay * 1.5, 60000);
+        if (Date.now() < deadline) {
+            window.setTimeout(poll, delay);
+        }
+    }
+
+    function poll() {
+        if (document.hidden) {
+            schedule();
+            return;
+        }
+        $.getJSON(url).done(function (data) {
+            if (data.state !== "pending") {
+                window.location.reload();
+            } else {
+                schedule();
+            }
+        }).fail(schedule);
+    }
+
+    window.setTimeout(poll, delay);
+});
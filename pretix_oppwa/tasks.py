@@ -0,0 +1,75 @@
+import logging
+import requests
+import threading
+from django.conf import settings
+from django.db import connection
+from django_scopes import scopes_disabled
+from pretix.base.models import Event, OrderPayment
+from pretix.base.payment import PaymentException
+from pretix.base.services.tasks import EventTask
+from pretix.celery_app import app
+
+logger = logging.getLogger(__name__)
+
+
+@app.task(base=EventTask, bind=True, max_retries=5, default_retry_delay=30)
+def process_notification(self, event: Event, payment: int, resource_path: str, datasource: str):
+    """
+    Fetches and processes the result of a payment OPPWA notified us about. Since the notification has already
+    been acknowledged, transport errors are retried here instead of relying on OPPWA to send it again.
+    """
+    try:
+        payment = OrderPayment.objects.select_related("order", "order__event").get(
+            order__event=event, pk=payment
+        )
+    except OrderPayment.DoesNotExist:
+        return
+
+    try:
+        payment.payment_provider.handle_payment_status(payment, resource_path, datasource)
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Could not fetch status of payment {payment.full_id}, retrying: {e}")
+        raise self.retry(exc=e)
+    except PaymentException:
+        logger.exception("Could not process payment")
+
+
+@app.task(base=EventTask)
+def precreate_checkout(event: Event, payment: int):
+    _precreate_checkout(event, payment)
+
+
+def _precreate_checkout(event, payment):
+    try:
+        payment = OrderPayment.objects.select_related("order", "order__event").get(
+            order__event=event, pk=payment
+        )
+    except OrderPayment.DoesNotExist:
+        return
+
+    try:
+        payment.payment_provider.precreate_checkout(payment)
+    except PaymentException:
+        # The error has been logged, the pay page will try again
+        pass
+
+
+def _precreate_checkout_in_thread(event, payment):
+    try:
+        with scopes_disabled():
+            _precreate_checkout(event, payment)
+    finally:
+        connection.close()
+
+
+def start_checkout_precreation(event: Event, payment: OrderPayment):
+    """
+    Creates the checkout of ``payment`` in the background, through celery if available. Without a broker, celery
+    tasks run eagerly, so a thread is used instead to not keep the customer waiting.
+    """
+    if settings.HAS_CELERY:
+        precreate_checkout.apply_async(kwargs={"event": event.pk, "payment": payment.pk})
+    else:
+        threading.Thread(
+            target=_precreate_checkout_in_thread, args=(event.pk, payment.pk), daemon=True
+        ).start()
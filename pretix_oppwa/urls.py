@@ -1,9 +1,14 @@
 from django.urls import include, path, re_path
+from pretix.multidomain import event_path
 
-from .views import NotifyView, PayView, ReturnView, redirect_view
+from .paymentmethods import payment_methods as oppwa_payment_methods
+from .views import (
+    NotifyView, PayView, ReturnView, StatusView, WebhookView, redirect_view,
+)
 
 
-def get_event_patterns(brand):
+def get_event_patterns(brand, payment_methods):
+    provider_identifiers = payment_methods.provider_identifiers(brand)
     return [
         re_path(
             r"^(?P<payment_provider>{})/".format(brand),
@@ -11,12 +16,12 @@ def get_event_patterns(brand):
                 [
                     path(
                         "pay/<str:order>/<str:hash>/<str:payment>/",
-                        PayView.as_view(),
+                        PayView.as_view(provider_identifiers=provider_identifiers),
                         name="pay",
                     ),
                     path(
                         "return/<str:order>/<str:hash>/<str:payment>/",
-                        ReturnView.as_view(),
+                        ReturnView.as_view(provider_identifiers=provider_identifiers),
                         name="return",
                     ),
                     path(
@@ -26,13 +31,26 @@ def get_event_patterns(brand):
                     ),
                     path(
                         "notify/<str:order>/<str:hash>/<str:payment>/",
-                        NotifyView.as_view(),
+                        NotifyView.as_view(provider_identifiers=provider_identifiers),
                         name="notify",
                     ),
+                    path(
+                        "status/<str:order>/<str:hash>/<str:payment>/",
+                        StatusView.as_view(provider_identifiers=provider_identifiers),
+                        name="status",
+                    ),
+                    # Webhooks are also configured for events that are not live yet, so the URL must not
+                    # depend on the event's live status
+                    event_path(
+                        "webhook/",
+                        WebhookView.as_view(provider_identifiers=provider_identifiers),
+                        name="webhook",
+                        require_live=False,
+                    ),
                 ]
             ),
         ),
     ]
 
 
-event_patterns = get_event_patterns("oppwa")
+event_patterns = get_event_patterns("oppwa", oppwa_payment_methods)
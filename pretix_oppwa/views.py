@@ -3,9 +3,14 @@ import re
 
 import requests
 import urllib.parse
+from django.conf import settings
 from django.contrib import messages
 from django.core import signing
-from django.http import Http404, HttpResponseBadRequest
+from django.core.cache import cache
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden,
+    JsonResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils.decorators import method_decorator
 from django.utils.functional import cached_property
@@ -16,14 +21,32 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import TemplateView
 from pretix.base.models import Order, OrderPayment
 from pretix.base.payment import PaymentException
+from pretix.base.settings import SettingsSandbox
 from pretix.multidomain.urlreverse import build_absolute_uri, eventreverse
 
+from pretix_oppwa import conf
+from pretix_oppwa.lookup import resolve_payment
+from pretix_oppwa.payment import (
+    FINAL_PAYMENT_STATES, PAYMENT_STATUS_CACHE_SECONDS,
+    payment_status_cache_key,
+)
+from pretix_oppwa.tasks import process_notification
+from pretix_oppwa.webhooks import InvalidNotification, decrypt_notification
 
 logger = logging.getLogger(__name__)
 
+valid_resource_path = re.compile("^/v[0-9]+/checkouts/[a-zA-Z0-9.-]+/payment$")
+
 
 class OPPWAOrderView:
+    # Identifiers of all providers of the brand, passed in by the URL configuration
+    provider_identifiers = ()
+
     def dispatch(self, request, *args, **kwargs):
+        self._load_order(request, kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    def _load_order(self, request, kwargs):
         url = request.resolver_match
         try:
             self.order = request.event.orders.get_with_secret_check(
@@ -31,18 +54,19 @@ class OPPWAOrderView:
             )
         except Order.DoesNotExist:
             raise Http404("")
-        return super().dispatch(request, *args, **kwargs)
 
     @cached_property
     def pprov(self):
         return self.payment.payment_provider
 
-    @property
+    @cached_property
     def payment(self):
+        # Going through the order's related manager attaches our order (and through it, the request's event) to
+        # the payment, so there is no need to join them.
         return get_object_or_404(
             self.order.payments,
             pk=self.kwargs["payment"],
-            provider__istartswith=self.kwargs["payment_provider"],
+            provider__in=self.provider_identifiers,
         )
 
     def _redirect_to_order(self):
@@ -70,28 +94,26 @@ class PayView(OPPWAOrderView, TemplateView):
             OrderPayment.PAYMENT_STATE_PENDING,
         ]:
             return self._redirect_to_order()
-        else:
-            ctx = self.get_context_data()
-            if ctx["checkouturl"] != "fail":
-                r = render(request, "pretix_oppwa/pay.html", ctx)
-                return r
-            else:
-                return self._redirect_to_order()
+
+        try:
+            checkouturl = self.pprov.get_checkout_url(self.payment)
+        except PaymentException:
+            return self._checkout_failed()
+        return render(request, "pretix_oppwa/pay.html", self.get_context_data(checkouturl=checkouturl))
+
+    def _checkout_failed(self):
+        messages.error(
+            self.request,
+            _(
+                "We had trouble communicating with the payment service. Please try again and get in touch with us if "
+                "this problem persists."
+            ),
+        )
+        return self._redirect_to_order()
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         ident = self.pprov.identifier.split("_")[0]
-        try:
-            ctx["checkouturl"] = self.pprov.create_checkout(self.payment)
-        except PaymentException:
-            ctx["checkouturl"] = "fail"
-            messages.error(
-                self.request,
-                _(
-                    "We had trouble communicating with the payment service. Please try again and get in touch with us if "
-                    "this problem persists."
-                ),
-            )
         ctx["order"] = self.order
         ctx["payment"] = self.payment
         ctx["brands"] = self.pprov.get_brands()
@@ -107,12 +129,8 @@ class PayView(OPPWAOrderView, TemplateView):
         )
         ctx["ident"] = ident
         ctx["entityId"] = self.pprov.get_entity_id(self.request.event.testmode)
-        if self.pprov.type == "meta" and self.pprov.get_setting(
-            "method_GOOGLEPAY_merchantId"
-        ):  # == scheme
-            ctx["googlepay_merchant_id"] = self.pprov.get_setting(
-                "method_GOOGLEPAY_merchantId"
-            )
+        if self.pprov.type == "meta" and self.pprov.config.googlepay_merchant_id:  # == scheme
+            ctx["googlepay_merchant_id"] = self.pprov.config.googlepay_merchant_id
         ctx["additional_head"] = self.pprov.additional_head or ""
         return ctx
 
@@ -122,61 +140,36 @@ class PayView(OPPWAOrderView, TemplateView):
 class ReturnView(OPPWAOrderView, View):
     viewsource = "return_view"
 
+    def _validation_failed(self):
+        messages.error(
+            self.request,
+            _(
+                "Sorry, we could not validate the payment result. Please try again or "
+                "contact the event organizer to check if your payment was successful."
+            ),
+        )
+        return self._redirect_to_order()
+
     def get(self, request, *args, **kwargs):
         path = request.GET.get("resourcePath")
-        valid_regex = re.compile("^/v[0-9]+/checkouts/[a-zA-Z0-9.-]+/payment$")
 
-        if not path or not valid_regex.match(path):
+        if not path or not valid_resource_path.match(path):
             logger.error(f"Illegal resourcePath: {path}")
-            messages.error(
-                self.request,
-                _(
-                    "Sorry, we could not validate the payment result. Please try again or "
-                    "contact the event organizer to check if your payment was successful."
-                ),
-            )
-            return self._redirect_to_order()
-
-        s = self.pprov._init_api(self.payment.order.testmode)
+            return self._validation_failed()
 
         try:
-            r = s.get(
-                "{}{}?entityId={}".format(
-                    self.pprov.get_endpoint_url(self.payment.order.testmode),
-                    path,
-                    self.pprov.get_entity_id(self.payment.order.testmode),
-                )
-            )
+            processed = self.pprov.handle_payment_status(self.payment, path, self.viewsource)
         except requests.exceptions.RequestException:
             logger.exception("Could not contact Hobex")
-            messages.error(
-                self.request,
-                _(
-                    "Sorry, we could not validate the payment result. Please try again or "
-                    "contact the event organizer to check if your payment was successful."
-                ),
-            )
-            return self._redirect_to_order()
-
-        d = r.json()
-        expected_id = self.pprov.get_merchant_transaction_id(self.payment)
-        if d.get('merchantTransactionId') != expected_id:
-            logger.error(f"Merchant transaction mismatch on {expected_id}: {d!r}")
-            messages.error(
-                self.request,
-                _(
-                    "Sorry, we could not validate the payment result. Please try again or "
-                    "contact the event organizer to check if your payment was successful."
-                ),
-            )
-            return self._redirect_to_order()
-
-        try:
-            self.pprov.process_result(self.payment, r.json(), self.viewsource)
+            return self._validation_failed()
         except PaymentException as e:
             logger.exception("Could not process payment")
             messages.error(self.request, str(e))
+            return self._redirect_to_order()
 
+        if not processed:
+            # The result has been processed by a concurrent request, so our copy of the order might be outdated
+            self.order.refresh_from_db(fields=["status"])
         return self._redirect_to_order()
 
 
@@ -185,6 +178,107 @@ class ReturnView(OPPWAOrderView, View):
 class NotifyView(ReturnView, OPPWAOrderView, View):
     viewsource = "notify_view"
 
+    @staticmethod
+    def acknowledge_first():
+        # Without a celery broker, tasks would run eagerly anyway, so we can just as well process inline.
+        return conf.getboolean("async_notifications") and settings.HAS_CELERY
+
+    def get(self, request, *args, **kwargs):
+        if not self.acknowledge_first():
+            return super().get(request, *args, **kwargs)
+        return self._enqueue(request)
+
+    def _enqueue(self, request):
+        path = request.GET.get("resourcePath")
+        if not path or not valid_resource_path.match(path):
+            logger.error(f"Illegal resourcePath: {path}")
+            return HttpResponseBadRequest("Invalid resourcePath")
+
+        if self.payment.state in FINAL_PAYMENT_STATES:
+            return HttpResponse("OK")
+
+        process_notification.apply_async(
+            kwargs={
+                "event": request.event.pk,
+                "payment": self.payment.pk,
+                "resource_path": path,
+                "datasource": self.viewsource,
+            }
+        )
+        return HttpResponse("OK")
+
+
+class StatusView(OPPWAOrderView, View):
+    """
+    Tells the pending page of a payment whether it is worth reloading. Polled repeatedly, so the answer is served
+    from the cache for a few seconds without even loading the order. Only requests with a valid secret ever fill
+    the cache, and the key includes the secret.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        # The order is only loaded if the state is not in the cache
+        return View.dispatch(self, request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        key = payment_status_cache_key(kwargs["payment"], kwargs["hash"])
+        data = cache.get(key)
+        if data is None:
+            self._load_order(request, kwargs)
+            data = {"state": self.payment.state}
+            cache.set(key, data, PAYMENT_STATUS_CACHE_SECONDS)
+
+        r = JsonResponse(data)
+        r["Cache-Control"] = "private, max-age={}".format(PAYMENT_STATUS_CACHE_SECONDS)
+        return r
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class WebhookView(View):
+    """
+    Receives the encrypted notifications of a webhook configured in the merchant account. They contain the
+    complete transaction, so once a notification has been decrypted, its result is processed right away.
+    """
+    # Identifiers of all providers of the brand, passed in by the URL configuration
+    provider_identifiers = ()
+
+    def post(self, request, *args, **kwargs):
+        brand = kwargs["payment_provider"]
+        secret = SettingsSandbox("payment", brand, request.event).get("webhook_secret")
+        if not secret:
+            raise Http404("")
+
+        try:
+            notification = decrypt_notification(
+                secret,
+                request.headers.get("X-Initialization-Vector"),
+                request.headers.get("X-Authentication-Tag"),
+                request.body,
+            )
+        except InvalidNotification as e:
+            logger.warning(f"Rejected webhook notification: {e}")
+            return HttpResponseForbidden("Invalid notification")
+
+        data = notification.get("payload") or {}
+        if notification.get("type") != "PAYMENT" or data.get("paymentType") != "DB":
+            # Refunds are processed synchronously, registrations and risk checks are of no interest to us
+            return HttpResponse("OK")
+
+        payment = resolve_payment(brand, data.get("merchantTransactionId") or "", event=request.event)
+        if payment is None or payment.provider not in self.provider_identifiers:
+            logger.info(f"Webhook notification for unknown transaction: {data.get('merchantTransactionId')}")
+            return HttpResponse("OK")
+
+        pprov = payment.payment_provider
+        if pprov is None:
+            logger.info(f"Webhook notification for payment {payment.full_id} of unavailable provider {payment.provider}")
+            return HttpResponse("OK")
+
+        try:
+            pprov.handle_webhook_result(payment, data)
+        except PaymentException:
+            logger.exception("Could not process payment")
+        return HttpResponse("OK")
+
 
 @xframe_options_exempt
 def redirect_view(request, *args, **kwargs):
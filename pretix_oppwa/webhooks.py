@@ -0,0 +1,36 @@
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from pretix_oppwa import codec
+
+
+class InvalidNotification(Exception):
+    pass
+
+
+def decrypt_notification(secret, iv, tag, body):
+    """
+    Decrypts and authenticates a webhook notification. OPPWA encrypts notifications with AES-256-GCM using the
+    merchant's webhook secret and sends the hex-encoded ciphertext as the body, along with the hex-encoded
+    initialization vector and authentication tag in the ``X-Initialization-Vector`` and ``X-Authentication-Tag``
+    headers.
+
+    Returns the decoded notification, e.g. ``{"type": "PAYMENT", "payload": {...}}``. Raises
+    ``InvalidNotification`` if the notification is malformed or can not be authenticated.
+    """
+    try:
+        key = bytes.fromhex(secret)
+        ciphertext = bytes.fromhex(body.decode()) + bytes.fromhex(tag)
+        iv = bytes.fromhex(iv)
+    except (AttributeError, TypeError, ValueError) as e:
+        raise InvalidNotification("Malformed notification: {}".format(e))
+
+    try:
+        plaintext = AESGCM(key).decrypt(iv, ciphertext, None)
+    except (InvalidTag, ValueError):
+        raise InvalidNotification("Notification could not be authenticated")
+
+    try:
+        return codec.loads(plaintext)
+    except ValueError as e:
+        raise InvalidNotification("Malformed notification: {}".format(e))
@@ -1,6 +1,7 @@
 import logging
 from django.utils.translation import gettext_lazy as _
 
+from pretix_oppwa import conf
 from pretix_oppwa.payment import (
     OPPWAMethod as SuperOPPWAMethod, OPPWASettingsHolder,
 )
@@ -25,6 +26,6 @@ class OPPWAMethod(SuperOPPWAMethod):
 
     def get_endpoint_url(self, testmode):
         if testmode:
-            return "https://test.vr-pay-ecommerce.de"
+            return conf.get("test_endpoint_url") or "https://test.vr-pay-ecommerce.de"
         else:
             return "https://vr-pay-ecommerce.de"
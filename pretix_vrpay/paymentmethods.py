@@ -1,5 +1,5 @@
 from pretix_oppwa.paymentmethods import (
-    get_payment_method_classes, payment_methods as payment_methods_repo,
+    LazyPaymentMethodClasses, payment_methods as payment_methods_repo,
 )
 
 from .payment import OPPWAMethod, VRPaySettingsHolder
@@ -28,12 +28,8 @@ supported_methods = [
     "APPLEPAY",
     "GOOGLEPAY",
 ]
-payment_methods = [
-    item
-    for item in payment_methods_repo
-    if item.get("identifier").upper() in supported_methods
-]
+payment_methods = payment_methods_repo.subset(supported_methods)
 
-payment_method_classes = get_payment_method_classes(
+payment_method_classes = LazyPaymentMethodClasses(
     "VRPay", payment_methods, OPPWAMethod, VRPaySettingsHolder
 )
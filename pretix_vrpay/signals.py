@@ -14,7 +14,7 @@ from pretix_vrpay.payment import VRPaySettingsHolder
 def register_payment_provider(sender, **kwargs):
     from .paymentmethods import payment_method_classes
 
-    return payment_method_classes
+    return payment_method_classes()
 
 
 @receiver(signal=process_response, dispatch_uid="payment_vrpay_middleware_resp")
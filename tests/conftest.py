@@ -0,0 +1,67 @@
+import pytest
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+from pretix.base.models import Event, Order, OrderPayment, Organizer
+
+
+@pytest.fixture
+def event():
+    with scopes_disabled():
+        organizer = Organizer.objects.create(name="Dummy", slug="dummy")
+        event = Event.objects.create(
+            organizer=organizer, name="Dummy", slug="dummy", date_from=now(), live=True, plugins="pretix_oppwa",
+            currency="EUR",
+        )
+        event.settings.set("payment_oppwa__enabled", True)
+        event.settings.set("payment_oppwa_scheme__enabled", True)
+        yield event
+
+
+@pytest.fixture
+def provider(event):
+    return event.get_payment_providers()["oppwa_scheme"]
+
+
+@pytest.fixture
+def order(event):
+    with scopes_disabled():
+        order = Order.objects.create(
+            event=event,
+            status=Order.STATUS_PENDING,
+            testmode=True,
+            datetime=now(),
+            expires=now() + timedelta(days=1),
+            total=Decimal("23.00"),
+            locale="en",
+            sales_channel=event.organizer.sales_channels.get(identifier="web"),
+        )
+        order.create_transactions()
+        yield order
+
+
+@pytest.fixture
+def payment(event, order, provider):
+    with scopes_disabled():
+        payment = order.payments.create(
+            provider=provider.identifier, amount=order.total, state=OrderPayment.PAYMENT_STATE_CREATED
+        )
+        payment = OrderPayment.objects.select_related("order").get(pk=payment.pk)
+        # Like in a request, the event and its settings have already been loaded
+        payment.order.event = event
+        event.settings.flush()
+        event.settings.timezone
+        ContentType.objects.get_for_model(Order)
+        yield payment
+
+
+@pytest.fixture
+def locmem_cache(settings):
+    # pretix' test settings use a dummy cache, which never stores anything
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    cache.clear()
+    yield
+    cache.clear()
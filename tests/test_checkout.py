@@ -0,0 +1,78 @@
+import itertools
+import pytest
+import time
+from django.core.cache import cache
+from django_scopes import scopes_disabled
+from pretix.base.models import OrderPayment
+from pretix.base.payment import PaymentException
+
+from pretix_oppwa import codec
+from pretix_oppwa.payment import OPPWAMethod
+
+CHECKOUT_ID = "8E1C5C1F0C1B4E0A8B2E1F7D4A6C9B3E.uat01-vm-tx02"
+
+
+@pytest.fixture
+def precreate(monkeypatch, locmem_cache):
+    monkeypatch.setenv("PRETIX_OPPWA_PRECREATE_CHECKOUT", "on")
+    monkeypatch.setenv("PRETIX_OPPWA_PRECREATE_WAIT", "0.3")
+
+
+@pytest.fixture
+def created_checkouts(monkeypatch):
+    created = []
+
+    def create_checkout(self, payment):
+        created.append(payment.pk)
+        return self._checkout_widget_url(payment.order.testmode, CHECKOUT_ID)
+
+    monkeypatch.setattr(OPPWAMethod, "create_checkout", create_checkout)
+    return created
+
+
+def _store_checkout(provider, payment):
+    stored = OrderPayment.objects.get(pk=payment.pk)
+    codec.set_info(stored, {
+        "id": CHECKOUT_ID,
+        "result": {"code": "000.200.100"},
+        "pretix_checkout": dict(provider._checkout_fingerprint(payment), created=int(time.time())),
+    })
+    stored.save(update_fields=["info"])
+
+
+@pytest.mark.django_db
+def test_pay_page_creates_checkout(precreate, created_checkouts, provider, payment):
+    with scopes_disabled():
+        assert CHECKOUT_ID in provider.get_checkout_url(payment)
+    assert created_checkouts == [payment.pk]
+
+
+@pytest.mark.django_db
+def test_pay_page_does_not_create_second_checkout_after_timeout(precreate, created_checkouts, provider, payment):
+    # The background task is still waiting for OPPWA
+    cache.add("{}:lock".format(provider._checkout_flight_key(payment)), True, 60)
+    with scopes_disabled():
+        with pytest.raises(PaymentException):
+            provider.get_checkout_url(payment)
+    assert created_checkouts == []
+
+
+@pytest.mark.django_db
+def test_pay_page_reuses_checkout_stored_after_timeout(precreate, created_checkouts, provider, payment):
+    cache.add("{}:lock".format(provider._checkout_flight_key(payment)), True, 60)
+    with scopes_disabled():
+        # The background task stored the checkout, but did not get to hand it over through the cache
+        _store_checkout(provider, payment)
+        assert CHECKOUT_ID in provider.get_checkout_url(payment)
+    assert created_checkouts == []
+
+
+@pytest.mark.django_db
+def test_background_task_does_not_create_second_checkout(precreate, created_checkouts, monkeypatch, provider, payment):
+    cache.add("{}:lock".format(provider._checkout_flight_key(payment)), True, 60)
+    # Skip the 15 seconds the background task waits
+    clock = itertools.count(step=5)
+    monkeypatch.setattr("pretix_oppwa.singleflight.time.monotonic", lambda: next(clock))
+    with scopes_disabled():
+        provider.precreate_checkout(payment)
+    assert created_checkouts == []
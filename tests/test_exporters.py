@@ -0,0 +1,44 @@
+import pytest
+from datetime import timedelta
+from decimal import Decimal
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+from pretix.base.models import Event, Order
+
+from pretix_oppwa import codec
+from pretix_oppwa.exporters import TransactionExporter
+
+
+def _rows(exporter):
+    return [r for r in exporter.iterate_list({}) if isinstance(r, list)][1:]
+
+
+@pytest.mark.django_db
+def test_multievent_export_only_contains_selected_events(event, payment):
+    with scopes_disabled():
+        codec.set_info(payment, {"id": "tx1", "paymentType": "DB", "result": {"code": "000.000.000"}})
+        payment.save(update_fields=["info"])
+        event.organizer.slug = "organizer"
+        event.organizer.save(update_fields=["slug"])
+
+        other = Event.objects.create(
+            organizer=event.organizer, name="Other", slug="other", date_from=now(), plugins="pretix_oppwa",
+            currency="EUR",
+        )
+        other_order = Order.objects.create(
+            event=other, status=Order.STATUS_PENDING, datetime=now(), expires=now() + timedelta(days=1),
+            total=Decimal("10.00"), sales_channel=event.organizer.sales_channels.get(identifier="web"),
+        )
+        other_order.payments.create(provider="oppwa_scheme", amount=Decimal("10.00"), state="created")
+
+        exporter = TransactionExporter(Event.objects.filter(pk=other.pk), event.organizer)
+        assert [r[0] for r in _rows(exporter)] == ["other"]
+        assert exporter.get_filename() == "organizer_oppwa_transactions"
+
+        exporter = TransactionExporter(Event.objects.filter(organizer=event.organizer), event.organizer)
+        assert sorted(r[0] for r in _rows(exporter)) == ["dummy", "other"]
+        assert exporter.get_filename() == "organizer_oppwa_transactions"
+
+        exporter = TransactionExporter(event, event.organizer)
+        assert [(r[0], r[8]) for r in _rows(exporter)] == [("dummy", "tx1")]
+        assert exporter.get_filename() == "dummy_oppwa_transactions"
@@ -0,0 +1,32 @@
+import pytest
+from django_scopes import scopes_disabled
+from pretix.base.models import OrderPayment
+
+from pretix_oppwa.payment import OPPWAMethod
+
+
+@pytest.mark.django_db
+def test_later_status_query_is_not_answered_from_earlier_result(monkeypatch, locmem_cache, provider, payment):
+    calls = []
+    codes = ["000.200.000", "000.000.000"]
+
+    def query_payment_status(self, payment, resource_path):
+        calls.append(resource_path)
+        return {
+            "id": "8ac7a4a18f6d1c2e018f6e5b7a3d4c21",
+            "paymentType": "DB",
+            "merchantTransactionId": self.get_merchant_transaction_id(payment),
+            "result": {"code": codes[len(calls) - 1]},
+        }
+
+    monkeypatch.setattr(OPPWAMethod, "query_payment_status", query_payment_status)
+    path = "/v1/checkouts/abc.def/payment"
+    with scopes_disabled():
+        assert provider.handle_payment_status(payment, path, "return_view")
+        assert payment.state == OrderPayment.PAYMENT_STATE_PENDING
+
+        payment = OrderPayment.objects.select_related("order").get(pk=payment.pk)
+        assert provider.handle_payment_status(payment, path, "notify_view")
+        assert len(calls) == 2
+        payment.refresh_from_db()
+        assert payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED
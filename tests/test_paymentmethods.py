@@ -0,0 +1,36 @@
+import pytest
+from pretix.base.models import Event
+
+from pretix_hobex import paymentmethods as hobex
+from pretix_oppwa import paymentmethods as oppwa
+from pretix_vrpay import paymentmethods as vrpay
+
+
+@pytest.mark.parametrize("module,brand,num_classes,num_fields", [
+    (oppwa, "OPPWA", 92, 123),
+    (vrpay, "VRPay", 11, 20),
+    (hobex, "hobex", 6, 12),
+])
+def test_lazy_classes_match_generated_classes(module, brand, num_classes, num_fields):
+    classes = module.payment_method_classes()
+    assert module.payment_method_classes() is classes
+
+    settingsholder, *providers = classes
+    expected = oppwa.get_payment_method_classes(brand, *module.payment_method_classes.args[1:])
+    assert len(classes) == num_classes
+    assert [c.identifier for c in classes] == [c.identifier for c in expected]
+    assert [[b.__name__ for b in c.__mro__] for c in classes] == [[b.__name__ for b in c.__mro__] for c in expected]
+    assert {c.identifier for c in providers} == module.payment_methods.provider_identifiers(brand)
+
+    fields = settingsholder.get_method_form_fields()
+    assert settingsholder.get_method_form_fields() is fields
+    assert len(fields) == num_fields
+    assert [f[0] for f in fields] == [f[0] for f in settingsholder._build_method_form_fields()]
+
+
+@pytest.mark.django_db
+def test_providers_are_registered(event):
+    providers = Event.objects.get(pk=event.pk).get_payment_providers()
+    assert oppwa.payment_methods.provider_identifiers("OPPWA") <= set(providers)
+    assert "oppwa_settings" in providers
+    assert "oppwa_scheme" in providers
@@ -0,0 +1,145 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django_scopes import scopes_disabled
+from pretix.base.models import OrderPayment, OrderRefund
+from pretix.base.services.locking import LockTimeoutException
+
+# Number of queries process_result issues per outcome. Most of them are pretix' own (confirming a payment marks
+# the order as paid and logs it, failing it reloads the payment), ours are the log entry of the result, a single
+# write of the payment or refund and the reference of the newly reported transaction id.
+PAYMENT_QUERIES = [
+    ("000.100.110", OrderPayment.PAYMENT_STATE_CONFIRMED, 37),
+    ("000.200.000", OrderPayment.PAYMENT_STATE_PENDING, 3),
+    ("800.100.151", OrderPayment.PAYMENT_STATE_FAILED, 21),
+]
+REFUND_QUERIES = [
+    ("000.100.110", OrderRefund.REFUND_STATE_DONE, 10),
+    ("000.200.000", OrderRefund.REFUND_STATE_TRANSIT, 2),
+    ("800.100.151", OrderRefund.REFUND_STATE_FAILED, 2),
+]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("code,state,num_queries", PAYMENT_QUERIES)
+def test_payment_result_queries(django_assert_num_queries, provider, payment, code, state, num_queries):
+    data = {
+        "id": "8ac7a4a18f6d1c2e018f6e5b7a3d4c21",
+        "paymentType": "DB",
+        "merchantTransactionId": provider.get_merchant_transaction_id(payment),
+        "result": {"code": code},
+    }
+    with scopes_disabled():
+        with django_assert_num_queries(num_queries):
+            provider.process_result(payment, data, "test")
+
+        payment.refresh_from_db()
+        assert payment.state == state
+        assert payment.info_data["id"] == data["id"]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("code,state,num_queries", REFUND_QUERIES)
+def test_refund_result_queries(django_assert_num_queries, provider, payment, code, state, num_queries):
+    with scopes_disabled():
+        payment.confirm()
+        refund = OrderRefund.objects.select_related("order", "payment").get(pk=payment.order.refunds.create(
+            payment=payment,
+            source=OrderRefund.REFUND_SOURCE_ADMIN,
+            state=OrderRefund.REFUND_STATE_TRANSIT,
+            amount=payment.amount,
+            provider=payment.provider,
+        ).pk)
+        data = {
+            "id": "8ac7a49f8f6d1c2e018f6e7c1b2a3d44",
+            "referencedId": "8ac7a4a18f6d1c2e018f6e5b7a3d4c21",
+            "paymentType": "RF",
+            "result": {"code": code},
+        }
+        with django_assert_num_queries(num_queries):
+            provider.process_result(refund, data, "test")
+
+        refund.refresh_from_db()
+        assert refund.state == state
+        assert refund.info_data["id"] == data["id"]
+
+
+@pytest.mark.django_db
+def test_compact_log_written_if_confirm_fails(monkeypatch, provider, payment):
+    def _mark_order_paid(self, *args, **kwargs):
+        raise LockTimeoutException()
+
+    monkeypatch.setenv("PRETIX_OPPWA_COMPACT_LOG", "on")
+    monkeypatch.setattr(OrderPayment, "_mark_order_paid", _mark_order_paid)
+    data = {
+        "id": "8ac7a4a18f6d1c2e018f6e5b7a3d4c21",
+        "paymentType": "DB",
+        "merchantTransactionId": provider.get_merchant_transaction_id(payment),
+        "result": {"code": "000.100.110"},
+    }
+    with scopes_disabled():
+        with pytest.raises(LockTimeoutException):
+            provider.process_result(payment, data, "test")
+
+        entry = payment.order.all_logentries().get(action_type="pretix_oppwa.oppwa.event")
+        assert entry.parsed_data["source"] == "test"
+        assert entry.parsed_data["data"]["id"] == data["id"]
+
+
+def _updates(ctx, table):
+    return [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('UPDATE "{}"'.format(table))]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("code", ["000.100.110", "000.200.000", "800.100.151"])
+def test_payment_result_written_once(provider, payment, code):
+    data = {
+        "id": "8ac7a4a18f6d1c2e018f6e5b7a3d4c21",
+        "paymentType": "DB",
+        "merchantTransactionId": provider.get_merchant_transaction_id(payment),
+        "result": {"code": code},
+    }
+    with scopes_disabled():
+        with CaptureQueriesContext(connection) as ctx:
+            provider.process_result(payment, data, "test")
+        assert len(_updates(ctx, "pretixbase_orderpayment")) == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("code", ["000.100.110", "000.200.000", "800.100.151"])
+def test_refund_result_written_once(provider, payment, code):
+    with scopes_disabled():
+        payment.confirm()
+        refund = payment.order.refunds.create(
+            payment=payment,
+            source=OrderRefund.REFUND_SOURCE_ADMIN,
+            state=OrderRefund.REFUND_STATE_TRANSIT,
+            amount=payment.amount,
+            provider=payment.provider,
+        )
+        data = {
+            "id": "8ac7a49f8f6d1c2e018f6e7c1b2a3d44",
+            "paymentType": "RF",
+            "result": {"code": code},
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            provider.process_result(refund, data, "test")
+        assert len(_updates(ctx, "pretixbase_orderrefund")) == 1
+
+
+@pytest.mark.django_db
+def test_pending_result_keeps_payment_confirmed_meanwhile(provider, payment):
+    data = {
+        "id": "8ac7a4a18f6d1c2e018f6e5b7a3d4c21",
+        "paymentType": "DB",
+        "merchantTransactionId": provider.get_merchant_transaction_id(payment),
+        "result": {"code": "000.200.000"},
+    }
+    with scopes_disabled():
+        # Confirmed by a concurrent request, e.g. the webhook, after this one loaded the payment
+        OrderPayment.objects.get(pk=payment.pk).confirm()
+
+        provider.process_result(payment, data, "test")
+
+        payment.refresh_from_db()
+        assert payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED
@@ -0,0 +1,36 @@
+import pytest
+from django_scopes import scopes_disabled
+from pretix.base.models import Event
+
+
+@pytest.mark.django_db
+def test_config_follows_changed_settings(event, provider):
+    with scopes_disabled():
+        event.settings.set("payment_oppwa_endpoint", "test")
+        event.settings.set("payment_oppwa_entityId", "first")
+        assert provider.config.default_entity_id == "first"
+
+        event.settings.set("payment_oppwa_entityId", "second")
+        assert provider.config.default_entity_id == "second"
+
+        event.settings.delete("payment_oppwa_entityId")
+        assert provider.config.default_entity_id is False
+
+        # Changed through another instance, e.g. by another process
+        Event.objects.get(pk=event.pk).settings.set("payment_oppwa_entityId", "third")
+        assert provider.config.default_entity_id is False
+        event.settings.flush()
+        assert provider.config.default_entity_id == "third"
+
+
+@pytest.mark.django_db
+def test_config_is_built_once(django_assert_num_queries, event, provider):
+    with scopes_disabled():
+        config = provider.config
+        with django_assert_num_queries(0):
+            configs = [
+                p.config for p in event.get_payment_providers().values()
+                if p.identifier.startswith("oppwa_") and hasattr(p, "config")
+            ]
+        assert len(configs) > 1
+        assert all(c is config for c in configs)
@@ -0,0 +1,98 @@
+import pytest
+from datetime import timedelta
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+from pretix.base.models import OrderPayment
+
+from pretix_oppwa import codec, reconcile
+
+
+def _create_payment(order, provider, state, age, info):
+    payment = order.payments.create(provider=provider.identifier, amount=order.total, state=state)
+    codec.set_info(payment, info)
+    payment.save(update_fields=["info"])
+    OrderPayment.objects.filter(pk=payment.pk).update(created=now() - age)
+    return payment
+
+
+@pytest.mark.django_db
+def test_pending_payments_include_checkouts(order, provider):
+    with scopes_disabled():
+        expired = _create_payment(order, provider, "created", timedelta(hours=1), {"id": "checkout"})
+        transaction = _create_payment(
+            order, provider, "created", timedelta(hours=1), {"id": "tx", "paymentType": "DB"}
+        )
+        pending = _create_payment(order, provider, "pending", timedelta(hours=1), {"id": "checkout"})
+        valid = _create_payment(order, provider, "created", timedelta(minutes=10), {"id": "checkout"})
+
+        assert set(reconcile.pending_payments()) == {expired, transaction, pending}
+        assert set(reconcile.pending_payments(min_age=timedelta(minutes=5))) == {expired, transaction, pending, valid}
+
+
+@pytest.mark.django_db
+def test_reconcile_expired_checkout_by_merchant_transaction_id(monkeypatch, order, provider):
+    checked = []
+
+    with scopes_disabled():
+        payment = _create_payment(order, provider, "created", timedelta(hours=1), {"id": "checkout"})
+        valid = _create_payment(order, provider, "created", timedelta(minutes=10), {"id": "checkout"})
+        merchant_transaction_id = provider.get_merchant_transaction_id(payment)
+
+        def _fetch(session, url, limiter):
+            checked.append(url)
+            return {
+                "result": {"code": "000.000.100"},
+                "payments": [
+                    {"id": "tx1", "paymentType": "DB", "merchantTransactionId": merchant_transaction_id,
+                     "result": {"code": "800.100.151"}},
+                    {"id": "tx2", "paymentType": "DB", "merchantTransactionId": merchant_transaction_id,
+                     "result": {"code": "000.000.000"}},
+                ],
+            }
+
+        monkeypatch.setattr(reconcile, "_fetch", _fetch)
+        stats = reconcile.reconcile_payments(reconcile.pending_payments())
+
+        assert len(checked) == 1
+        assert "/v1/query?merchantTransactionId={}&entityId=".format(merchant_transaction_id) in checked[0]
+        assert stats["success"] == 1
+        payment.refresh_from_db()
+        assert payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED
+        assert codec.get_info(payment)["id"] == "tx2"
+        assert provider.get_reconciliation_resource_path(valid) == "/v1/checkouts/checkout/payment"
+
+
+@pytest.mark.django_db
+def test_reconcile_expired_checkout_without_transaction(monkeypatch, order, provider):
+    monkeypatch.setattr(reconcile, "_fetch", lambda session, url, limiter: {"result": {"code": "700.400.580"}})
+    with scopes_disabled():
+        payment = _create_payment(order, provider, "created", timedelta(hours=1), {"id": "checkout"})
+        stats = reconcile.reconcile_payments(reconcile.pending_payments())
+
+        assert stats["unchanged"] == 1
+        payment.refresh_from_db()
+        assert payment.state == OrderPayment.PAYMENT_STATE_CREATED
+
+
+@pytest.mark.django_db
+def test_reconcile_continues_where_limit_stopped(monkeypatch, locmem_cache, order, provider):
+    checked = []
+
+    def _fetch(session, url, limiter):
+        checked.append(url)
+        return {"result": {"code": "000.200.000"}}
+
+    monkeypatch.setattr(reconcile, "_fetch", _fetch)
+    with scopes_disabled():
+        for i in range(5):
+            _create_payment(order, provider, "pending", timedelta(hours=1), {"id": "tx{}".format(i), "paymentType": "DB"})
+
+        def run():
+            del checked[:]
+            reconcile.reconcile_payments(reconcile.pending_payments(), limit=2, cursor_key="test")
+            return {url.split("?")[0].rsplit("/", 1)[-1] for url in checked}
+
+        assert run() == {"tx0", "tx1"}
+        assert run() == {"tx2", "tx3"}
+        assert run() == {"tx4", "tx0"}
+        assert run() == {"tx1", "tx2"}
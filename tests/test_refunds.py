@@ -0,0 +1,82 @@
+import pytest
+from decimal import Decimal
+from django_scopes import scopes_disabled
+from pretix.base.models import Order, OrderRefund
+from pretix.base.services.cancelevent import cancel_event
+from pretix.base.services.orders import _try_auto_refund
+
+from pretix_oppwa import codec
+from pretix_oppwa.payment import OPPWAMethod
+from pretix_oppwa.refunds import execute_refunds, pending_refunds
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.content = codec.dumps(data)
+
+
+class FakeSession:
+    def __init__(self):
+        self.posted = []
+
+    def post(self, url, data):
+        self.posted.append(url)
+        return FakeResponse({"id": "8ac7a4a28f6d1c2e018f6e9a0b1c2d3e", "paymentType": "RF",
+                             "result": {"code": "000.000.000"}})
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(OPPWAMethod, "_init_api", lambda self, testmode: session)
+    return session
+
+
+@pytest.fixture
+def paid_order(monkeypatch, event, order, payment):
+    monkeypatch.setenv("PRETIX_OPPWA_BULK_REFUNDS", "on")
+    with scopes_disabled():
+        item = event.items.create(name="Ticket", default_price=Decimal("23.00"))
+        order.positions.create(item=item, price=Decimal("23.00"), positionid=1)
+        codec.set_info(payment, {"id": "8ac7a4a18f6d1c2e018f6e5b7a3d4c21", "paymentType": "DB",
+                                 "result": {"code": "000.000.000"}})
+        payment.confirm()
+        return order
+
+
+@pytest.mark.django_db
+def test_admin_refund_is_sent_right_away(session, paid_order):
+    with scopes_disabled():
+        paid_order.status = Order.STATUS_CANCELED
+        paid_order.save(update_fields=["status"])
+        _try_auto_refund(paid_order.pk, source=OrderRefund.REFUND_SOURCE_ADMIN)
+
+        refund = paid_order.refunds.get()
+        assert refund.state == OrderRefund.REFUND_STATE_DONE
+        assert len(session.posted) == 1
+        assert not pending_refunds().exists()
+
+
+@pytest.mark.django_db
+def test_cancellation_refund_is_sent_even_if_confirmed_manually(session, event, paid_order):
+    with scopes_disabled():
+        cancel_event.apply(kwargs=dict(
+            event=event.pk, subevent=None, auto_refund=True, keep_fee_fixed="0.00", keep_fee_per_ticket="",
+            keep_fee_percentage="0.00",
+        ))
+
+        refund = paid_order.refunds.get()
+        assert refund.state == OrderRefund.REFUND_STATE_CREATED
+        assert session.posted == []
+        assert list(pending_refunds()) == [refund]
+
+        # An admin confirms the refund as done before it has been sent
+        refund.done()
+
+        stats = execute_refunds(pending_refunds())
+        assert stats["success"] == 1
+        assert len(session.posted) == 1
+        refund.refresh_from_db()
+        assert refund.state == OrderRefund.REFUND_STATE_DONE
+        assert codec.get_info(refund)["id"] == "8ac7a4a28f6d1c2e018f6e9a0b1c2d3e"
+        assert not pending_refunds().exists()
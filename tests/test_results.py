@@ -0,0 +1,35 @@
+import pytest
+from django.core.management import call_command
+from io import StringIO
+
+from pretix_oppwa import results
+from pretix_oppwa.management.commands.oppwa_benchmark_results import (
+    CODES, classify_uncompiled,
+)
+
+
+@pytest.mark.parametrize("code,category", [
+    ("000.000.000", results.SUCCESS),
+    ("000.100.110", results.SUCCESS),
+    ("000.300.000", results.SUCCESS),
+    ("000.600.000", results.SUCCESS),
+    ("000.400.000", results.REVIEW),
+    ("000.400.100", results.REVIEW),
+    ("000.400.030", results.REJECTED),
+    ("000.200.000", results.PENDING),
+    ("800.400.500", results.PENDING_LONG),
+    ("100.400.500", results.PENDING_LONG),
+    ("800.100.151", results.REJECTED),
+    ("100.396.101", results.REJECTED),
+    ("", results.REJECTED),
+])
+def test_classify(code, category):
+    assert results.classify(code) == category
+    assert classify_uncompiled(code) == category
+
+
+def test_benchmark_classifies_like_before():
+    out, err = StringIO(), StringIO()
+    call_command("oppwa_benchmark_results", iterations=len(CODES), repeat=1, stdout=out, stderr=err)
+    assert err.getvalue() == ""
+    assert "ns per result code" in out.getvalue()
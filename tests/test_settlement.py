@@ -0,0 +1,86 @@
+import pytest
+from django_scopes import scopes_disabled
+from pretix.base.models import OrderPayment, OrderRefund
+
+from pretix_oppwa.lookup import resolve_transactions
+from pretix_oppwa.settlement import SettlementImporter
+
+
+@pytest.fixture
+def refunds(provider, payment):
+    with scopes_disabled():
+        payment.confirm()
+        refunds = {}
+        for transaction_id in ("8ac7a49f8f6d1c2e018f6e7c1b2a3d44", "8ac7a49f8f6d1c2e018f6e7c1b2a3d4411"):
+            refund = payment.order.refunds.create(
+                payment=payment,
+                source=OrderRefund.REFUND_SOURCE_ADMIN,
+                state=OrderRefund.REFUND_STATE_CREATED,
+                amount=payment.amount,
+                provider=payment.provider,
+            )
+            provider.process_result(
+                refund, {"id": transaction_id, "paymentType": "RF", "result": {"code": "000.200.000"}}, "test"
+            )
+            refunds[transaction_id] = refund
+        return refunds
+
+
+@pytest.fixture
+def pending_payment(provider, payment):
+    with scopes_disabled():
+        provider.process_result(
+            payment,
+            {"id": "8ac7a4a18f6d1c2e018f6e5b7a3d4c21", "paymentType": "DB", "result": {"code": "000.200.000"}},
+            "test",
+        )
+        return payment
+
+
+@pytest.mark.django_db
+def test_refunds_matched_by_transaction_id(refunds, payment):
+    importer = SettlementImporter("oppwa", dry_run=True)
+    with scopes_disabled():
+        stats = importer.run([
+            {"UniqueId": "8ac7a49f8f6d1c2e018f6e7c1b2a3d44", "PaymentType": "RF", "Amount": "23.00",
+             "ResultCode": "000.000.000"},
+            {"UniqueId": "8ac7a49f8f6d1c2e018f6e7c1b2a3d", "PaymentType": "RF", "Amount": "23.00",
+             "ResultCode": "000.000.000"},
+        ])
+    assert stats["updated"] == 1
+    assert stats["unmatched"] == 1
+
+
+@pytest.mark.django_db
+def test_refunds_looked_up_by_reference(django_assert_num_queries, refunds):
+    with scopes_disabled():
+        with django_assert_num_queries(1) as ctx:
+            found = resolve_transactions("oppwa", ["8ac7a49f8f6d1c2e018f6e7c1b2a3d4411", "unknown"], refunds=True)
+    assert found == {"8ac7a49f8f6d1c2e018f6e7c1b2a3d4411": refunds["8ac7a49f8f6d1c2e018f6e7c1b2a3d4411"]}
+    assert "info" not in ctx.captured_queries[0]["sql"].split("WHERE")[1]
+
+
+@pytest.mark.django_db
+def test_payment_matched_by_transaction_id(pending_payment):
+    importer = SettlementImporter("oppwa")
+    with scopes_disabled():
+        stats = importer.run([
+            {"UniqueId": "8ac7a4a18f6d1c2e018f6e5b7a3d4c21", "PaymentType": "DB", "Amount": "23.00",
+             "ResultCode": "000.000.000"},
+        ])
+        pending_payment.refresh_from_db()
+    assert stats["updated"] == 1
+    assert pending_payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED
+
+
+@pytest.mark.django_db
+def test_rows_without_result_code_are_not_processed(provider, pending_payment):
+    importer = SettlementImporter("oppwa")
+    with scopes_disabled():
+        stats = importer.run([
+            {"UniqueId": "8ac7a4a18f6d1c2e018f6e5b7a3d4c21", "PaymentType": "DB", "Amount": "23.00",
+             "MerchantTransactionId": provider.get_merchant_transaction_id(pending_payment)},
+        ])
+        pending_payment.refresh_from_db()
+    assert stats["invalid"] == 1
+    assert pending_payment.state == OrderPayment.PAYMENT_STATE_PENDING
@@ -0,0 +1,25 @@
+import pytest
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import resolve
+from pretix.multidomain.urlreverse import eventreverse
+
+from pretix_oppwa.payment import OPPWASettingsHolder
+from pretix_oppwa.signals import wrapped_signal_process_response
+
+
+def _response(event, url):
+    request = RequestFactory().get(url)
+    request.resolver_match = resolve(url)
+    return wrapped_signal_process_response(OPPWASettingsHolder, event, request, HttpResponse())
+
+
+@pytest.mark.django_db
+def test_csp_added_to_payment_pages(event, order):
+    url = eventreverse(event, "presale:event.order.pay.change", kwargs={"order": order.code, "secret": order.secret})
+    assert "https://oppwa.com/" in _response(event, url)["Content-Security-Policy"]
+
+
+@pytest.mark.django_db
+def test_csp_not_added_to_other_pages(event):
+    assert "Content-Security-Policy" not in _response(event, eventreverse(event, "presale:event.index"))
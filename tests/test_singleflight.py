@@ -0,0 +1,26 @@
+from django.core.cache import cache
+
+from pretix_oppwa import singleflight
+
+
+def test_waiter_reuses_result_stored_just_before_lock_release(monkeypatch, locmem_cache):
+    cache.add("key:lock", True, 60)
+    get = cache.get
+
+    def get_and_finish(key, *args, **kwargs):
+        if key == "key:lock":
+            # The executing caller stores its result and releases the lock right after the waiter looked for the
+            # result, but before it checks the lock
+            cache.set("key:result", "first", 2)
+            cache.delete("key:lock")
+        return get(key, *args, **kwargs)
+
+    monkeypatch.setattr(singleflight.cache, "get", get_and_finish)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return "second"
+
+    assert singleflight.single_flight("key", fn, result_timeout=None, interval=0) == ("first", False)
+    assert calls == []
@@ -0,0 +1,94 @@
+import pytest
+import requests
+import threading
+
+from pretix_oppwa import standin
+from pretix_oppwa.standin import StandInGateway, make_server
+
+
+@pytest.fixture
+def gateway():
+    return StandInGateway(result_codes=("000.100.110",), refund_result_codes=("000.000.000",))
+
+
+@pytest.fixture
+def server(gateway):
+    server = make_server("127.0.0.1", 0, gateway)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://{}:{}".format(*server.server_address[:2])
+    server.shutdown()
+    server.server_close()
+
+
+def test_payment_and_refund(gateway):
+    status, checkout = gateway.handle("POST", "/v1/checkouts", {
+        "entityId": "abc", "amount": "23.00", "currency": "EUR", "paymentType": "DB", "merchantTransactionId": "M1",
+    })
+    assert status == 200
+    assert checkout["result"]["code"] == standin.CHECKOUT_CREATED_CODE
+
+    status, payment = gateway.handle("GET", "/v1/checkouts/{}/payment".format(checkout["id"]), {})
+    assert status == 200
+    assert payment["result"]["code"] == "000.100.110"
+    assert payment["merchantTransactionId"] == "M1"
+    # The outcome of a checkout does not change once it has been queried
+    assert gateway.handle("GET", "/v1/checkouts/{}/payment".format(checkout["id"]), {}) == (200, payment)
+    assert gateway.handle("GET", "/v1/query/{}".format(payment["id"]), {}) == (200, payment)
+
+    status, refund = gateway.handle("POST", "/v1/payments/{}".format(payment["id"]), {
+        "paymentType": "RF", "amount": "5.00",
+    })
+    assert status == 200
+    assert refund["result"]["code"] == "000.000.000"
+    assert refund["referencedId"] == payment["id"]
+    assert refund["amount"] == "5.00"
+
+    status, data = gateway.handle("GET", "/v1/query", {"merchantTransactionId": "M1"})
+    assert data["result"]["code"] == standin.QUERY_SUCCESS_CODE
+    assert [p["id"] for p in data["payments"]] == [payment["id"], refund["id"]]
+
+
+@pytest.mark.parametrize("method,path,data", [
+    ("POST", "/v1/checkouts", {"amount": "23.00"}),
+    ("GET", "/v1/checkouts/unknown/payment", {}),
+    ("GET", "/v1/query/unknown", {}),
+    ("POST", "/v1/payments/unknown", {"paymentType": "RF"}),
+    ("GET", "/v1/unknown", {}),
+])
+def test_invalid_requests(gateway, method, path, data):
+    status, response = gateway.handle(method, path, data)
+    assert status in (400, 404)
+    assert response["result"]["code"] == standin.INVALID_REQUEST_CODE
+
+
+def test_unknown_merchant_transaction_id(gateway):
+    status, data = gateway.handle("GET", "/v1/query", {"merchantTransactionId": "M1"})
+    assert status == 200
+    assert data["result"]["code"] == standin.NOT_FOUND_CODE
+
+
+def test_http_server(server):
+    r = requests.post(server + "/v1/checkouts", data={"entityId": "abc", "amount": "23.00"}, timeout=5)
+    assert r.status_code == 200
+    checkout_id = r.json()["id"]
+
+    r = requests.get(server + "/v1/checkouts/{}/payment".format(checkout_id), timeout=5)
+    assert r.json()["result"]["code"] == "000.100.110"
+
+    r = requests.get(server + "/v1/paymentWidgets.js", params={"checkoutId": checkout_id}, timeout=5)
+    assert r.headers["Content-Type"] == "application/javascript"
+
+
+def test_http_server_errors(gateway, server):
+    gateway.error_rate = 1
+    r = requests.post(server + "/v1/checkouts", data={"entityId": "abc", "amount": "23.00"}, timeout=5)
+    assert r.status_code == 500
+    assert r.json()["result"]["code"] == standin.SERVER_ERROR_CODE
+
+
+@pytest.mark.django_db
+def test_only_test_mode_uses_stand_in(monkeypatch, provider):
+    monkeypatch.setenv("PRETIX_OPPWA_TEST_ENDPOINT_URL", "http://127.0.0.1:8899")
+    assert provider.get_endpoint_url(testmode=True) == "http://127.0.0.1:8899"
+    assert provider.get_endpoint_url(testmode=False) == "https://oppwa.com"
@@ -0,0 +1,109 @@
+import pytest
+import time
+from django_scopes import scopes_disabled
+from pretix.base.models import Order, OrderPayment
+from pretix.multidomain.urlreverse import eventreverse
+
+from pretix_oppwa import codec
+from pretix_oppwa.payment import OPPWAMethod
+
+
+def _url(payment, step, **params):
+    tag = "plugins:pretix_oppwa:{}".format(step)
+    url = eventreverse(payment.order.event, tag, kwargs={
+        "order": payment.order.code,
+        "payment": payment.pk,
+        "hash": payment.order.tagged_secret(tag),
+        "payment_provider": "oppwa",
+    })
+    if params:
+        url += "?" + "&".join("{}={}".format(k, v) for k, v in params.items())
+    return url
+
+
+def _payment_queries(ctx):
+    return [
+        q["sql"] for q in ctx.captured_queries
+        if q["sql"].startswith("SELECT") and 'FROM "pretixbase_orderpayment"' in q["sql"]
+    ]
+
+
+@pytest.fixture
+def checkout(provider, payment):
+    codec.set_info(payment, {
+        "id": "8E1C5C1F0C1B4E0A8B2E1F7D4A6C9B3E.uat01-vm-tx02",
+        "result": {"code": "000.200.100"},
+        "pretix_checkout": dict(provider._checkout_fingerprint(payment), created=int(time.time())),
+    })
+    payment.save(update_fields=["info"])
+    return payment
+
+
+@pytest.fixture
+def pending_status(monkeypatch, provider, payment):
+    data = {
+        "id": "8ac7a4a18f6d1c2e018f6e5b7a3d4c21",
+        "paymentType": "DB",
+        "merchantTransactionId": provider.get_merchant_transaction_id(payment),
+        "result": {"code": "000.200.000"},
+    }
+    monkeypatch.setattr(OPPWAMethod, "query_payment_status", lambda self, payment, resource_path: data)
+    return data
+
+
+@pytest.mark.django_db
+def test_pay_view_loads_payment_once(client, django_assert_num_queries, checkout):
+    with django_assert_num_queries(19) as ctx:
+        r = client.get(_url(checkout, "pay"))
+    assert r.status_code == 200
+    assert "8E1C5C1F0C1B4E0A8B2E1F7D4A6C9B3E.uat01-vm-tx02" in r.content.decode()
+
+    payment_queries = _payment_queries(ctx)
+    assert len(payment_queries) == 1
+    assert '"pretixbase_orderpayment"."provider" IN' in payment_queries[0]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("step", ["return", "notify"])
+def test_result_views_load_payment_once(client, django_assert_num_queries, pending_status, payment, step):
+    # Most queries are pretix' own, for the session, the event and the order
+    with django_assert_num_queries(19) as ctx:
+        r = client.get(_url(payment, step, resourcePath="/v1/checkouts/abc.def/payment"))
+    assert r.status_code == 302
+
+    payment_queries = _payment_queries(ctx)
+    assert len(payment_queries) == 1
+    assert '"pretixbase_orderpayment"."provider" IN' in payment_queries[0]
+    with scopes_disabled():
+        payment.refresh_from_db()
+    assert payment.state == OrderPayment.PAYMENT_STATE_PENDING
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("provider_identifier", ["vrpay_scheme", "oppwa_settings", "OPPWA_scheme", "oppwa_other"])
+def test_views_ignore_payments_of_other_providers(client, payment, provider_identifier):
+    # Only exact identifiers of the brand's payment methods match, not every provider sharing its prefix
+    with scopes_disabled():
+        payment.provider = provider_identifier
+        payment.save(update_fields=["provider"])
+    assert client.get(_url(payment, "return", resourcePath="/v1/checkouts/abc.def/payment")).status_code == 404
+
+
+@pytest.mark.django_db
+def test_return_view_confirms_payment_if_quota_exceeded(monkeypatch, client, provider, payment):
+    data = {
+        "id": "8ac7a4a18f6d1c2e018f6e5b7a3d4c21",
+        "paymentType": "DB",
+        "merchantTransactionId": provider.get_merchant_transaction_id(payment),
+        "result": {"code": "000.100.110"},
+    }
+    monkeypatch.setattr(OPPWAMethod, "query_payment_status", lambda self, payment, resource_path: data)
+    monkeypatch.setattr(Order, "_can_be_paid", lambda self, *args, **kwargs: "Sold out")
+
+    r = client.get(_url(payment, "return", resourcePath="/v1/checkouts/abc.def/payment"))
+    assert r.status_code == 302
+
+    with scopes_disabled():
+        payment.refresh_from_db()
+        assert payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED
+        assert payment.order.status == Order.STATUS_PENDING
@@ -0,0 +1,57 @@
+import json
+import os
+import pytest
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from django_scopes import scopes_disabled
+from pretix.base.models import Event, OrderPayment
+
+SECRET = os.urandom(32)
+
+
+@pytest.fixture
+def webhook_secret(event):
+    event.settings.set("payment_oppwa_webhook_secret", SECRET.hex())
+
+
+def _post(client, event, notification):
+    iv = os.urandom(12)
+    encrypted = AESGCM(SECRET).encrypt(iv, json.dumps(notification).encode(), None)
+    return client.post(
+        "/{}/{}/oppwa/webhook/".format(event.organizer.slug, event.slug),
+        encrypted[:-16].hex().upper(),
+        content_type="text/plain",
+        HTTP_X_INITIALIZATION_VECTOR=iv.hex(),
+        HTTP_X_AUTHENTICATION_TAG=encrypted[-16:].hex(),
+    )
+
+
+def _notification(provider, payment):
+    return {
+        "type": "PAYMENT",
+        "payload": {
+            "id": "8ac7a4a18f6d1c2e018f6e5b7a3d4c21",
+            "paymentType": "DB",
+            "merchantTransactionId": provider.get_merchant_transaction_id(payment),
+            "result": {"code": "000.000.000"},
+        },
+    }
+
+
+@pytest.mark.django_db
+def test_webhook_confirms_payment(client, webhook_secret, event, provider, payment):
+    r = _post(client, event, _notification(provider, payment))
+    assert r.status_code == 200
+    with scopes_disabled():
+        payment.refresh_from_db()
+    assert payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED
+
+
+@pytest.mark.django_db
+def test_webhook_acknowledges_payment_of_unavailable_provider(monkeypatch, client, webhook_secret, event, provider, payment):
+    notification = _notification(provider, payment)
+    monkeypatch.setattr(Event, "get_payment_providers", lambda self, cached=False: {})
+    r = _post(client, event, notification)
+    assert r.status_code == 200
+    with scopes_disabled():
+        payment.refresh_from_db()
+    assert payment.state == OrderPayment.PAYMENT_STATE_CREATED